@@ -49,6 +49,8 @@ LOGIN_FORM_RE = re.compile(
     r'<form\b[^>]*class=["\'][^"\']*form-signin[^"\']*["\'][^>]*>',
     re.IGNORECASE,
 )
+# поиск по сырым байтам ответа: без декодирования и копии .lower() всей страницы
+LOGIN_PAGE_RE = re.compile(rb"form-signin", re.IGNORECASE)
 FORM_ACTION_RE = re.compile(
     r'action=["\'](?P<action>[^"\']+)["\']',
     re.IGNORECASE,
@@ -167,8 +169,7 @@ class AfterbuyClient:
     def _verify_authenticated(self) -> bool:
         response = self.session.get(self.protected_url, timeout=self.timeout)
         response = self._follow_hidden_forms(response)
-        html_lower = response.text.lower()
-        return "form-signin" not in html_lower
+        return LOGIN_PAGE_RE.search(response.content) is None
 
 
 def read_env_file(path: Path) -> Dict[str, str]:
@@ -257,6 +258,22 @@ def run_login_for_account(account: str, credentials: Dict[str, str]) -> Optional
     return cookies_path
 
 
+def login_account(account: str, env_path: Path = Path(".env")) -> Path:
+    """Log in one account with credentials from .env and save its cookies; raises on failure."""
+    key = account.upper()
+    accounts = {acc.upper(): creds for acc, creds in extract_accounts(read_env_file(env_path)).items()}
+    creds = accounts.get(key)
+    if not creds:
+        raise ValueError(f"Credentials for '{key}' not found in {env_path}.")
+    domain = ACCOUNT_DOMAINS.get(key)
+    if not domain:
+        raise ValueError(f"No domain configured for account '{key}'.")
+    cookies_path = run_login_for_account(key, {**creds, "domain": domain})
+    if cookies_path is None:
+        raise AfterbuyLoginError(f"Login for account '{key}' failed.")
+    return cookies_path
+
+
 def main() -> None:
     args = parse_args()
     logger = configure_logging(args.verbose)
@@ -79,6 +79,7 @@ from getEANfromJSON import (  # noqa: E402
     build_ready_index as ean_build_ready_index,
     extract_eans as ean_extract_eans,
     load_collections as ean_load_collections,
+    scan_cache_dir as ean_scan_cache_dir,
 )
 
 
@@ -454,6 +455,7 @@ def api_ean_factory(account: str, factory_id: str):
             sources,
             dedupe=True,
             include_empty=True,
+            cache_dir=ean_scan_cache_dir(account),
         )
     except ValueError as exc:
         return jsonify({"error": str(exc), "code": "parse_error"}), 500
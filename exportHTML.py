@@ -1,4 +1,5 @@
 import subprocess
+import logging
 import os, re, sys, json, glob, time, threading
 import typing as t
 import requests
@@ -7,6 +8,14 @@ from requests.adapters import HTTPAdapter
 from requests.utils import cookiejar_from_dict, dict_from_cookiejar
 from loguru import logger
 
+from env_utils import env_int
+
+try:
+    import Login as login_module  # авторизация в том же процессе, без запуска нового интерпретатора
+    from logging_utils import InterceptHandler
+except Exception:  # noqa: BLE001
+    login_module = None
+
 # ---------- утилиты ----------
 def log(msg: str, level: str = "INFO") -> None:
     logger.opt(depth=1).log(level.upper(), msg)
@@ -61,13 +70,6 @@ if LOG_FILE:
     except Exception as exc:
         logger.warning(f"Не удалось подключить лог-файл '{LOG_FILE}': {exc}")
 
-def _env_int(name: str, default: int) -> int:
-    try:
-        value = int(os.environ.get(name, default))
-        return value if value > 0 else default
-    except (TypeError, ValueError):
-        return default
-
 def _env_float(name: str, default: float) -> float:
     try:
         value = float(os.environ.get(name, default))
@@ -77,10 +79,10 @@ def _env_float(name: str, default: float) -> float:
 
 MAX_WORKERS = 10
 REQUEST_DELAY = _env_float("EXPORTHTML_DELAY", 0.0)
-SUBMIT_CHUNK = _env_int("EXPORTHTML_SUBMIT_CHUNK", 100)
-MAX_FETCH_RETRIES = _env_int("EXPORTHTML_RETRIES", 4)
-MIN_HTML_LENGTH = _env_int("EXPORTHTML_MIN_SIZE", 256)
-RELOGIN_FILE_CHUNK = _env_int("EXPORTHTML_LOGIN_CHUNK", 100)
+SUBMIT_CHUNK = env_int("EXPORTHTML_SUBMIT_CHUNK", 100)
+MAX_FETCH_RETRIES = env_int("EXPORTHTML_RETRIES", 4)
+MIN_HTML_LENGTH = env_int("EXPORTHTML_MIN_SIZE", 256)
+RELOGIN_FILE_CHUNK = env_int("EXPORTHTML_LOGIN_CHUNK", 100)
 _THREAD_LOCAL = threading.local()
 _COOKIES_CACHE: dict[str, t.Mapping[str, str]] = {}
 _COOKIES_LOCK = threading.Lock()
@@ -215,6 +217,28 @@ def _load_cookie_dict(path: str) -> t.Mapping[str, str]:
 
 
 def _run_login(account: str) -> int:
+    if login_module is not None:
+        log(f"[{account}] Авторизация для обновления cookies", "INFO")
+        # Login пишет в std logging — на время входа перенаправляем его записи в sinks loguru
+        login_logger = login_module.LOGGER
+        saved_level, saved_propagate = login_logger.level, login_logger.propagate
+        handler = InterceptHandler()
+        login_logger.addHandler(handler)
+        login_logger.setLevel(logging.DEBUG)
+        login_logger.propagate = False
+        try:
+            login_module.login_account(account)
+            return 0
+        except (ValueError, login_module.AfterbuyLoginError) as exc:
+            # учётные данные не подходят — Login.py в отдельном процессе упрётся в то же самое
+            log(f"[{account}] Авторизация не удалась: {exc}", "ERROR")
+            return 1
+        except Exception as exc:  # noqa: BLE001
+            log(f"[{account}] Авторизация в процессе не удалась ({exc}), запускаю Login.py", "WARNING")
+        finally:
+            login_logger.removeHandler(handler)
+            login_logger.setLevel(saved_level)
+            login_logger.propagate = saved_propagate
     cmd = [sys.executable, "Login.py", "--account", account]
     log(f"[{account}] Запуск Login.py для обновления cookies", "INFO")
     try:
@@ -2,29 +2,56 @@ from __future__ import annotations
 
 import argparse
 import csv
+import functools
 import json
 import logging
 import os
 import re
+import shutil
+import string
 import sys
 import tempfile
+import threading
+import time
 import unicodedata
-from dataclasses import dataclass
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field
 from pathlib import Path
-from typing import Iterable, List, Optional, Sequence, Set, Tuple
+from typing import Callable, Iterable, List, Optional, Sequence, Set, Tuple
 
 
 class EmptyItemIdsError(ValueError):
     """Raised when items file contains no item_ids."""
 
 import requests
+from requests.adapters import HTTPAdapter
 from requests.exceptions import Timeout
+from urllib3.util.request import ACCEPT_ENCODING
+
+try:
+    import simdjson  # type: ignore
+except ImportError:  # опциональная зависимость — откатываемся на stdlib json
+    simdjson = None
+
+try:
+    import orjson  # type: ignore
+except ImportError:
+    orjson = None
+
+try:
+    import ahocorasick  # type: ignore
+except ImportError:
+    ahocorasick = None
 
 from logging_utils import setup_logging
 from getFabrik import (
     ACCOUNT_ORDER,
-    SelectOptionParser,
+    RETRY_POLICY,
+    AfterbuyClient,
     ensure_authenticated_session,
+    get_credentials,
+    iter_options,
 )  # type: ignore
 
 
@@ -38,11 +65,19 @@ EXPORT_ENDPOINT = "/afterbuy/im-export.aspx"
 GET_TIMEOUT = 30
 POST_TIMEOUT = 180
 STREAM_CHUNK_SIZE = 1024 * 1024  # 1 MiB
+EXPORT_WORKERS = 4
+DISCOVER_WORKERS = 8
+# fsync каждого CSV по умолчанию включён; EXPORTLISTER_FSYNC=0 отключает его для быстрых повторных выгрузок
+FSYNC_EXPORTS = os.environ.get("EXPORTLISTER_FSYNC", "1") != "0"
+POOL_CONNECTIONS = 8
+POOL_MAXSIZE = 32
 
 DEFAULT_EXPPROD = "3"
 DEFAULT_EXPORT_DEFINITION = "72404"
 DEFAULT_EXPORT_FORMAT_ID = "72404"
 DEFAULT_EXPORT_ENCODING = "1"
+DEFINITION_CACHE_PATH = Path(".cache") / "lister_definitions.json"
+DEFINITION_CACHE_TTL = 24 * 60 * 60  # сутки
 
 LISTER_REFERER_TEMPLATE = (
     "https://{domain}/afterbuy/ebayliste2.aspx?"
@@ -54,6 +89,30 @@ LISTER_REFERER_TEMPLATE = (
     "lAWSellerPaymentProfile=0&lAWSellerReturnPolicyProfile=0&lAWSellerShippingProfile=0"
 )
 
+_LOGIN_PAGE_RE = re.compile(rb"form-signin", re.IGNORECASE)
+_DEFINITION_SELECT_RE = re.compile(
+    rb'<select\b[^>]*\bname\s*=\s*(["\']?)definition\1(?=[\s>/])[^>]*>(?P<body>.*?)</select>',
+    re.IGNORECASE | re.DOTALL,
+)
+_ALLOWED_FILENAME_CHARS = frozenset(string.ascii_letters + string.digits + "._-")
+# недопустимые ASCII-символы -> пробел; split/join затем схлопывает каждую серию в один "_"
+_SANITIZE_TABLE = str.maketrans(
+    {chr(code): " " for code in range(128) if chr(code) not in _ALLOWED_FILENAME_CHARS}
+)
+_STRIP_CHARS = "._-"
+
+# неизменяемые части заголовков; per-call добавляются только Referer/Origin
+HTML_ACCEPT = "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8"
+HTML_HEADERS = {"Accept": HTML_ACCEPT, "Cache-Control": "max-age=0"}
+SELECTION_HEADERS = {**HTML_HEADERS, "Content-Type": "application/x-www-form-urlencoded"}
+EXPORT_HEADERS = {
+    "Content-Type": "application/x-www-form-urlencoded",
+    "Accept": "text/csv, text/plain, application/octet-stream, */*;q=0.8",
+    # всё, что urllib3 умеет распаковать (br — если установлен brotli); CSV сжимается в разы
+    "Accept-Encoding": ACCEPT_ENCODING,
+    "Cache-Control": "max-age=0",
+}
+
 LOGGER = logging.getLogger("exportLister")
 
 
@@ -64,9 +123,19 @@ class ListerExportTask:
     factory_name: str
     item_ids: List[str]
     source_path: Path
+    _filename: Optional[str] = field(default=None, init=False, repr=False, compare=False)
+    _joined_ids: Optional[str] = field(default=None, init=False, repr=False, compare=False)
 
     def default_filename(self) -> str:
-        return build_filename(self.factory_name, self.factory_id)
+        if self._filename is None:
+            self._filename = build_filename(self.factory_name, self.factory_id)
+        return self._filename
+
+    def joined_ids(self) -> str:
+        """item_ids через запятую — нужны в обоих POST и при каждом повторе экспорта."""
+        if self._joined_ids is None:
+            self._joined_ids = ",".join(self.item_ids)
+        return self._joined_ids
 
     @property
     def expected_count(self) -> int:
@@ -79,61 +148,101 @@ class ExportConfig:
     export_format_id: str
     export_encoding: str
     expprod: Optional[str]
+    # формат CSV задаёт сам экспорт: разделитель определяем по первому файлу и переиспользуем
+    csv_delimiter: Optional[str] = field(default=None, compare=False)
 
 
 # ===== Утилиты =====
+@functools.lru_cache(maxsize=4096)
 def build_filename(name: str, factory_id: str) -> str:
     base = f"{name}_{factory_id}".strip("_") if name else f"factory_{factory_id}"
-    normalized = unicodedata.normalize("NFKD", base)
-    ascii_name = normalized.encode("ascii", "ignore").decode("ascii")
-    cleaned = re.sub(r"[^A-Za-z0-9._-]+", "_", ascii_name).strip("._-")
+    if base.isascii():
+        # NFKD не меняет ASCII — для типичных кодов фабрик нормализация не нужна
+        ascii_name = base
+    else:
+        normalized = unicodedata.normalize("NFKD", base)
+        ascii_name = normalized.encode("ascii", "ignore").decode("ascii")
+    cleaned = "_".join(ascii_name.translate(_SANITIZE_TABLE).split()).strip(_STRIP_CHARS)
     if not cleaned:
         cleaned = f"factory_{factory_id}"
     return f"{cleaned}.csv"[:160]
 
 
-def _atomic_write_bytes(target: Path, first_chunk: bytes, chunk_iter) -> None:
+def _atomic_write_bytes(target: Path, first_chunk: bytes, stream) -> int:
+    """Пишет поток через временный файл; возвращает размер. Пустой ответ target не заменяет."""
     target.parent.mkdir(parents=True, exist_ok=True)
-    with tempfile.NamedTemporaryFile(dir=target.parent, delete=False) as tmp:
+    # replace() — это rename, второй записи данных нет; буфер под размер чанка убирает лишние write()
+    with tempfile.NamedTemporaryFile(dir=target.parent, delete=False, buffering=STREAM_CHUNK_SIZE) as tmp:
         tmp_path = Path(tmp.name)
-        if first_chunk:
-            tmp.write(first_chunk)
-        for c in chunk_iter:
-            if c:
-                tmp.write(c)
-        tmp.flush()
-        os.fsync(tmp.fileno())
+        try:
+            if first_chunk:
+                tmp.write(first_chunk)
+            shutil.copyfileobj(stream, tmp, length=STREAM_CHUNK_SIZE)
+            size = tmp.tell()
+            if size and FSYNC_EXPORTS:
+                tmp.flush()
+                os.fsync(tmp.fileno())
+        except BaseException:
+            tmp.close()
+            tmp_path.unlink(missing_ok=True)
+            raise
+    if not size:
+        tmp_path.unlink(missing_ok=True)
+        return 0
     tmp_path.replace(target)
+    return size
 
 
 def _normalize_sequence(values: Optional[Sequence[str]]) -> List[str]:
-    seen, out = set(), []
     if not values:
-        return out
-    for raw in values:
-        if raw is None:
-            continue
-        for piece in str(raw).split(","):
-            cleaned = piece.strip()
-            if cleaned and cleaned not in seen:
-                seen.add(cleaned)
-                out.append(cleaned)
-    return out
+        return []
+    # одна склейка и один split на C-уровне; dict.fromkeys убирает дубли с сохранением порядка
+    joined = ",".join(str(raw) for raw in values if raw is not None)
+    return list(dict.fromkeys(cleaned for cleaned in map(str.strip, joined.split(",")) if cleaned))
 
 
-def _count_csv_rows(path: Path) -> int:
-    """Количество строк-товаров: пытаемся определить разделитель, вычитаем заголовок."""
+def _sniff_delimiter(sample: str) -> str:
+    try:
+        return csv.Sniffer().sniff(sample, delimiters=",;|\t").delimiter
+    except Exception:
+        return csv.get_dialect("excel").delimiter
+
+
+def _count_lines_unquoted(path: Path) -> Optional[int]:
+    """Число строк через bytes.count; None, если в файле есть кавычки (возможны переводы строк внутри полей)."""
+    lines = 0
+    last = b""
+    with path.open("rb") as f:
+        while True:
+            chunk = f.read(STREAM_CHUNK_SIZE)
+            if not chunk:
+                break
+            if b'"' in chunk:
+                return None
+            lines += chunk.count(b"\n")
+            last = chunk[-1:]
+    if last and last != b"\n":
+        lines += 1
+    return lines
+
+
+def _count_csv_rows(path: Path, config: Optional[ExportConfig] = None) -> int:
+    """Количество строк-товаров без заголовка; разделитель берётся из config, если уже известен."""
     try:
+        rows = _count_lines_unquoted(path)
+        if rows is not None:
+            return max(rows - 1, 0)
         with path.open("r", encoding="utf-8", newline="") as f:
-            sample = f.read(4096)
-            if not sample:
-                return 0
-            try:
-                dialect = csv.Sniffer().sniff(sample, delimiters=",;|\t")
-            except Exception:
-                dialect = csv.get_dialect("excel")
-            f.seek(0)
-            reader = csv.reader(f, dialect)
+            delimiter = config.csv_delimiter if config is not None else None
+            if delimiter is None:
+                sample = f.read(4096)
+                if not sample:
+                    return 0
+                delimiter = _sniff_delimiter(sample)
+                if config is not None:
+                    config.csv_delimiter = delimiter
+                f.seek(0)
+            reader = csv.reader(f, delimiter=delimiter)
             count = -1
             for _ in reader:
                 count += 1
@@ -147,11 +256,25 @@ def _count_csv_rows(path: Path) -> int:
 
 
 # ===== Загрузка задач =====
-def load_factory_from_json(path: Path) -> ListerExportTask:
-    raw = json.loads(path.read_text(encoding="utf-8"))
-    factory_id = str(raw.get("factory_id") or "")
-    factory_name = str(raw.get("factory_name") or "")
-    item_ids_raw = raw.get("item_ids")
+def _read_factory_fields(path: Path, parser=None) -> Tuple[str, str, object]:
+    """Читает только factory_id, factory_name и item_ids из JSON коллекции."""
+    if parser is None:
+        raw = orjson.loads(path.read_bytes()) if orjson is not None else json.loads(path.read_text(encoding="utf-8"))
+        return raw.get("factory_id"), raw.get("factory_name"), raw.get("item_ids")
+    doc = parser.parse(path.read_bytes())
+    # объекты simdjson живут, пока парсер не переиспользован — сразу переводим в Python
+    item_ids_raw = doc.get("item_ids")
+    if isinstance(item_ids_raw, simdjson.Array):
+        item_ids_raw = item_ids_raw.as_list()
+    fields = (doc.get("factory_id"), doc.get("factory_name"), item_ids_raw)
+    del doc
+    return fields
+
+
+def load_factory_from_json(path: Path, parser=None) -> ListerExportTask:
+    factory_id_raw, factory_name_raw, item_ids_raw = _read_factory_fields(path, parser)
+    factory_id = str(factory_id_raw or "")
+    factory_name = str(factory_name_raw or "")
     if not factory_id:
         raise ValueError(f"Файл {path} не содержит 'factory_id'.")
     if not isinstance(item_ids_raw, Iterable):
@@ -166,6 +289,49 @@ def load_factory_from_json(path: Path) -> ListerExportTask:
     return ListerExportTask(factory_id, factory_name, item_ids, path)
 
 
+_PARSER_LOCAL = threading.local()
+
+
+def _thread_parser():
+    """simdjson.Parser не потокобезопасен — по одному на поток, переиспользуется между файлами."""
+    if simdjson is None:
+        return None
+    parser = getattr(_PARSER_LOCAL, "parser", None)
+    if parser is None:
+        parser = _PARSER_LOCAL.parser = simdjson.Parser()
+    return parser
+
+
+def _try_load_task(path: Path) -> Optional[ListerExportTask]:
+    try:
+        return load_factory_from_json(path, _thread_parser())
+    except EmptyItemIdsError:
+        LOGGER.debug("Пропуск %s: пустой список item_ids.", path)
+    except Exception as exc:  # noqa: BLE001
+        LOGGER.error("Не удалось прочитать %s: %s", path, exc)
+    return None
+
+
+def _may_match_ids(filename: str, id_set: Set[str]) -> bool:
+    stem = filename[: -len(".json")]
+    _, sep, tail = stem.rpartition("_")
+    if not sep or not tail.isdigit():
+        # имя не по соглашению — id узнаем только из содержимого
+        return True
+    return tail in id_set
+
+
+def _build_name_matcher(patterns: Sequence[str]) -> Callable[[str], bool]:
+    """Предикат «имя содержит хотя бы один шаблон»; с pyahocorasick — один проход автомата по имени."""
+    if ahocorasick is not None and len(patterns) > 1:
+        automaton = ahocorasick.Automaton()
+        for pattern in patterns:
+            automaton.add_word(pattern, pattern)
+        automaton.make_automaton()
+        return lambda name: next(automaton.iter(name), None) is not None
+    return lambda name: any(p in name for p in patterns)
+
+
 def discover_lister_tasks(
     account: str,
     factory_ids: Sequence[str],
@@ -177,33 +343,67 @@ def discover_lister_tasks(
     if not directory.exists():
         LOGGER.warning("Каталог с коллекциями не найден: %s (аккаунт %s)", directory, account_key)
         return []
-    id_set = {v.strip() for v in factory_ids if v.strip()}
+    id_set = frozenset(v.strip() for v in factory_ids if v.strip())
     name_patterns = [v.lower() for v in name_filters if v]
+    name_matches = _build_name_matcher(name_patterns) if name_patterns else None
     tasks: List[ListerExportTask] = []
-    for path in sorted(directory.glob("*.json")):
-        try:
-            task = load_factory_from_json(path)
-        except EmptyItemIdsError:
-            LOGGER.debug("Пропуск %s: пустой список item_ids.", path)
-            continue
-        except Exception as exc:  # noqa: BLE001
-            LOGGER.error("Не удалось прочитать %s: %s", path, exc)
+    # scandir отдаёт тип записи из самого чтения каталога — без stat() на каждый файл
+    with os.scandir(directory) as entries:
+        json_names = [entry.name for entry in entries if entry.name.endswith(".json") and entry.is_file()]
+    if id_set:
+        # getItems пишет коллекции как <имя>_<id>.json — чужие id отсекаем до чтения и разбора
+        json_names = [name for name in json_names if _may_match_ids(name, id_set)]
+    json_names.sort()
+    paths = [directory / name for name in json_names]
+    if limit is None and len(paths) > 1:
+        # нужны все файлы — чтение с диска перекрываем в пуле; map сохраняет порядок
+        with ThreadPoolExecutor(max_workers=DISCOVER_WORKERS) as executor:
+            loaded: Iterable[Optional[ListerExportTask]] = list(executor.map(_try_load_task, paths))
+    else:
+        # с limit читаем лениво, чтобы остановиться на нужном количестве
+        loaded = map(_try_load_task, paths)
+    for task in loaded:
+        if task is None:
             continue
         if id_set and task.factory_id not in id_set:
             continue
-        if name_patterns:
-            cand = (task.factory_name or "").lower()
-            if not any(p in cand for p in name_patterns):
-                continue
+        if name_matches is not None and not name_matches((task.factory_name or "").lower()):
+            continue
         tasks.append(task)
         if limit is not None and len(tasks) >= limit:
             break
     return tasks
 
 
-def find_existing_export(output_dir: Path, task: ListerExportTask) -> Optional[Path]:
-    p = output_dir / task.default_filename()
-    return p if p.is_file() else None
+def list_existing_exports(output_dir: Path) -> Set[str]:
+    """Имена CSV в каталоге аккаунта — один проход вместо проверки на каждую задачу."""
+    try:
+        with os.scandir(output_dir) as entries:
+            return {entry.name for entry in entries if entry.name.endswith(".csv") and entry.is_file()}
+    except FileNotFoundError:
+        return set()
+
+
+def find_existing_export(
+    output_dir: Path,
+    task: ListerExportTask,
+    existing_names: Optional[Set[str]] = None,
+) -> Optional[Path]:
+    filename = task.default_filename()
+    # имя детерминировано — обычно хватает одной проверки точного совпадения
+    if existing_names is None:
+        exact = output_dir / filename
+        if exact.is_file():
+            return exact
+        existing_names = list_existing_exports(output_dir)
+    elif filename in existing_names:
+        return output_dir / filename
+    # коллекцию могли переименовать: ищем CSV с тем же id в конце имени
+    suffix = f"_{task.factory_id}.csv"
+    for name in existing_names:
+        if name.endswith(suffix):
+            return output_dir / name
+    return None
 
 
 def _normalize_ean_value(value) -> Optional[str]:
@@ -262,6 +462,87 @@ def cleanup_existing_outputs(account: str, csv_path: Path) -> None:
 
 
 # ===== HTTP =====
+def _is_login_page(response: requests.Response) -> bool:
+    # ищем маркер прямо в байтах — без декодирования и копии .lower() всего тела
+    return _LOGIN_PAGE_RE.search(response.content) is not None
+
+
+def _iter_definition_options(content: bytes, encoding: str) -> Iterable[Tuple[str, str]]:
+    """Пары (value, label) из <select name="definition">: select вырезаем регуляркой, options разбирает getFabrik."""
+    select_match = _DEFINITION_SELECT_RE.search(content)
+    if not select_match:
+        return
+    yield from iter_options(select_match.group("body"), encoding)
+
+
+class LoginRequiredError(RuntimeError):
+    """Сервер вернул страницу логина вместо ожидаемого ответа."""
+
+
+def _mount_export_adapter(session: requests.Session) -> requests.Session:
+    adapter = HTTPAdapter(
+        pool_connections=POOL_CONNECTIONS,
+        pool_maxsize=POOL_MAXSIZE,
+        max_retries=RETRY_POLICY,
+    )
+    session.mount("https://", adapter)
+    session.headers["Connection"] = "keep-alive"
+    return session
+
+
+def open_export_session(account: str) -> Tuple[requests.Session, str]:
+    """Авторизованная сессия с пулом keep-alive соединений на весь аккаунт."""
+    session, domain = ensure_authenticated_session(account)
+    return _mount_export_adapter(session), domain
+
+
+def login_export_session(account: str, domain: str) -> requests.Session:
+    """Новый вход без сохранённых кук: отдельная серверная сессия со своим выбором и фильтром листера."""
+    creds = get_credentials(account.upper())
+    return _mount_export_adapter(AfterbuyClient(creds["login"], creds["password"], domain).login())
+
+
+class WorkerExportSessions:
+    """Своя сессия входа на каждый поток пула: выбор и фильтр листера Afterbuy хранит на сервере в сессии."""
+
+    def __init__(self, account: str, domain: str) -> None:
+        self.account = account
+        self.domain = domain
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        # входы идут по одному: ни старт пула, ни волна протухших сессий не шлют N логинов разом
+        self._login_lock = threading.Lock()
+        self._sessions: List[requests.Session] = []
+
+    def _open(self) -> requests.Session:
+        with self._login_lock:
+            session = login_export_session(self.account, self.domain)
+        self._local.session = session
+        with self._lock:
+            self._sessions.append(session)
+        return session
+
+    def get(self) -> Tuple[requests.Session, str]:
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = self._open()
+        return session, self.domain
+
+    def renew(self, stale: requests.Session) -> Tuple[requests.Session, str]:
+        # протухшую сессию держит только текущий поток — закрывать её безопасно
+        LOGGER.info("[%s] Сессия истекла — повторный вход.", self.account)
+        with self._lock:
+            self._sessions.remove(stale)
+        stale.close()
+        return self._open(), self.domain
+
+    def close(self) -> None:
+        with self._lock:
+            sessions, self._sessions = self._sessions, []
+        for session in sessions:
+            session.close()
+
+
 def detect_lister_definition(
     session: requests.Session,
     domain: str,
@@ -269,20 +550,13 @@ def detect_lister_definition(
     preferred_label: str = "Lister",
 ) -> Optional[str]:
     url = f"https://{domain}{EXPORT_ENDPOINT}"
-    headers = {
-        "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
-        "Cache-Control": "max-age=0",
-        "Referer": url,
-    }
-    response = session.get(url, headers=headers, timeout=GET_TIMEOUT)
+    response = session.get(url, headers={**HTML_HEADERS, "Referer": url}, timeout=GET_TIMEOUT)
     response.raise_for_status()
-    if "form-signin" in response.text.lower():
-        raise RuntimeError("Сессия не авторизована — получена страница логина.")
-    parser = SelectOptionParser("definition")
-    parser.feed(response.text)
+    if _is_login_page(response):
+        raise LoginRequiredError("Сессия не авторизована — получена страница логина.")
     preferred_lower = preferred_label.lower()
     fallback: Optional[str] = None
-    for value, label in parser.options:
+    for value, label in _iter_definition_options(response.content, response.encoding or "utf-8"):
         value = value.strip()
         label_clean = label.strip()
         if not value or value == "0":
@@ -296,42 +570,41 @@ def detect_lister_definition(
 
 def prepare_lister_page(session: requests.Session, domain: str, factory_id: str) -> Tuple[str, str]:
     base_url = f"https://{domain}{LISTER_ENDPOINT}"
-    base_headers = {
-        "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
-        "Cache-Control": "max-age=0",
-    }
-    base_response = session.get(base_url, headers=base_headers, timeout=GET_TIMEOUT)
+    base_response = session.get(base_url, headers=HTML_HEADERS, timeout=GET_TIMEOUT)
     base_response.raise_for_status()
-    if "form-signin" in base_response.text.lower():
-        raise RuntimeError("Сессия не авторизована — получена страница логина.")
+    if _is_login_page(base_response):
+        raise LoginRequiredError("Сессия не авторизована — получена страница логина.")
 
     referer_url = LISTER_REFERER_TEMPLATE.format(domain=domain, factory_id=factory_id)
-    filter_headers = {
-        "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
-        "Cache-Control": "max-age=0",
-        "Referer": base_url,
-    }
-    filter_response = session.get(referer_url, headers=filter_headers, timeout=GET_TIMEOUT)
+    filter_response = session.get(referer_url, headers={**HTML_HEADERS, "Referer": base_url}, timeout=GET_TIMEOUT)
     filter_response.raise_for_status()
-    if "form-signin" in filter_response.text.lower():
-        raise RuntimeError("Сессия не авторизована — получена страница логина.")
+    if _is_login_page(filter_response):
+        raise LoginRequiredError("Сессия не авторизована — получена страница логина.")
     return base_url, referer_url
 
 
-def build_selection_payload(item_ids: Sequence[str]) -> List[Tuple[str, str]]:
+def build_selection_payload(item_ids: Sequence[str], joined_ids: Optional[str] = None) -> bytes:
+    """Тело POST выбора товаров, уже закодированное в x-www-form-urlencoded.
+
+    item_ids должны быть уже очищены (load_factory_from_json убирает пробелы и пустые значения).
+    """
     if not item_ids:
         raise ValueError("Список item_ids пуст — нечего экспортировать.")
     payload: List[Tuple[str, str]] = [("art2", "selectexportauswahl"), ("Lister_Button", "Ausführen")]
-    for item_id in item_ids:
-        clean_id = item_id.strip()
-        if not clean_id:
-            continue
-        payload.append(("id", clean_id))
-        payload.append((f"said_{clean_id}", "0"))
-        payload.append((f"vtid_{clean_id}", "0"))
-        payload.append((f"Menge_{clean_id}", "0"))
-        payload.append((f"vid_{clean_id}", "0"))
-    joined_ids = ",".join(item_ids)
+    # по пять пар на товар: extend готового кортежа без вложенного генератора
+    extend = payload.extend
+    for clean_id in item_ids:
+        extend(
+            (
+                ("id", clean_id),
+                ("said_" + clean_id, "0"),
+                ("vtid_" + clean_id, "0"),
+                ("Menge_" + clean_id, "0"),
+                ("vid_" + clean_id, "0"),
+            )
+        )
+    if joined_ids is None:
+        joined_ids = ",".join(item_ids)
     payload.extend(
         [
             ("art", "selectexportauswahl"),
@@ -345,7 +618,7 @@ def build_selection_payload(item_ids: Sequence[str]) -> List[Tuple[str, str]]:
             ("CopyToListerIds", ""),
         ]
     )
-    return payload
+    return urllib.parse.urlencode(payload).encode("ascii")
 
 
 def build_export_definition_payload(
@@ -355,8 +628,10 @@ def build_export_definition_payload(
     export_format_id: Optional[str],
     export_encoding: str,
     definition: str,
-) -> List[Tuple[str, str]]:
-    joined_ids = ",".join(item_ids)
+    joined_ids: Optional[str] = None,
+) -> bytes:
+    if joined_ids is None:
+        joined_ids = ",".join(item_ids)
     payload: List[Tuple[str, str]] = []
     if expprod is not None:
         payload.append(("expprod", expprod))
@@ -364,7 +639,7 @@ def build_export_definition_payload(
     if export_format_id is not None:
         payload.append(("ExportFormatID", export_format_id))
     payload.extend([("id", joined_ids), ("art", "export"), ("definition", definition)])
-    return payload
+    return urllib.parse.urlencode(payload).encode("ascii")
 
 
 def _select_and_export(
@@ -377,41 +652,38 @@ def _select_and_export(
     domain: str,
     config: ExportConfig,
     retries: int = 1,
+    joined_ids: Optional[str] = None,
 ):
     """Одна попытка = select, затем export; при ошибке повторяем пару."""
-    selection_headers = {
-        "Content-Type": "application/x-www-form-urlencoded",
-        "Referer": referer_url,
-        "Origin": f"https://{domain}",
-        "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
-        "Cache-Control": "max-age=0",
-    }
-    export_headers = {
-        "Content-Type": "application/x-www-form-urlencoded",
-        "Referer": base_url,
-        "Origin": f"https://{domain}",
-        "Accept": "text/csv, text/plain, application/octet-stream, */*;q=0.8",
-        "Cache-Control": "max-age=0",
-    }
-
-    selection_payload = build_selection_payload(item_ids)
+    origin = f"https://{domain}"
+    selection_headers = {**SELECTION_HEADERS, "Referer": referer_url, "Origin": origin}
+    export_headers = {**EXPORT_HEADERS, "Referer": base_url, "Origin": origin}
+
+    # тела кодируются один раз и переиспользуются во всех попытках
+    if joined_ids is None:
+        joined_ids = ",".join(item_ids)
+    selection_payload = build_selection_payload(item_ids, joined_ids)
     export_payload = build_export_definition_payload(
         item_ids,
         expprod=config.expprod,
         export_format_id=config.export_format_id,
         export_encoding=config.export_encoding,
         definition=config.definition_id,
+        joined_ids=joined_ids,
     )
 
+    selection_applied = False
     for attempt in range(retries + 1):
-        # select
-        sel = session.post(base_url, data=selection_payload, headers=selection_headers, timeout=POST_TIMEOUT)
-        try:
-            sel.raise_for_status()
-            if "form-signin" in sel.text.lower():
-                raise RuntimeError("Сессия не авторизована — получена страница логина.")
-        finally:
-            sel.close()
+        # select — повторяем только если предыдущий выбор не был принят сервером
+        if not selection_applied:
+            sel = session.post(base_url, data=selection_payload, headers=selection_headers, timeout=POST_TIMEOUT)
+            try:
+                sel.raise_for_status()
+                if _is_login_page(sel):
+                    raise LoginRequiredError("Сессия не авторизована — получена страница логина.")
+            finally:
+                sel.close()
+            selection_applied = True
 
         # export
         resp = session.post(export_url, data=export_payload, headers=export_headers, timeout=POST_TIMEOUT, stream=True)
@@ -422,6 +694,9 @@ def _select_and_export(
             resp.close()
             if attempt == retries:
                 raise
+            # 4xx — серверное состояние выбора могло потеряться, выбираем заново
+            if 400 <= resp.status_code < 500:
+                selection_applied = False
 
 
 def download_lister_csv(
@@ -443,37 +718,100 @@ def download_lister_csv(
         referer_url=referer_url,
         export_url=export_url,
         item_ids=task.item_ids,
+        joined_ids=task.joined_ids(),
         domain=domain,
         config=config,
         retries=1,
     )
 
     content_type = (response.headers.get("Content-Type") or "").lower()
+    disposition = (response.headers.get("Content-Disposition") or "").lower()
     target_path = output_dir / task.default_filename()
 
-    chunk_iter = response.iter_content(chunk_size=STREAM_CHUNK_SIZE)
-    first_chunk: Optional[bytes] = None
-    for chunk in chunk_iter:
-        if chunk:
-            first_chunk = chunk
-            break
-    if first_chunk is None:
-        first_chunk = b""
+    # закрываем в finally: при обрыве посреди потока соединение тоже должно вернуться в пул
+    try:
+        response.raw.decode_content = True
+        if "csv" in content_type or ("attachment" in disposition and "text/html" not in content_type):
+            # заголовки однозначно указывают на файл — пишем поток с первого байта без пробного чтения
+            first_chunk = b""
+        else:
+            # тип неясен: первый кусок читаем заранее, чтобы распознать HTML-страницу
+            first_chunk = response.raw.read(STREAM_CHUNK_SIZE) or b""
+            if "text/html" in content_type:
+                preview = first_chunk.decode("utf-8", errors="ignore")
+                raise RuntimeError(
+                    "Ожидался CSV-файл, но получен HTML документ. "
+                    f"Возможна ошибка авторизации. Ответ сервера: {preview[:200]}"
+                )
+            if not first_chunk:
+                raise RuntimeError("Ответ сервера пуст — экспорт не был сформирован.")
 
-    if "text/html" in content_type and "csv" not in content_type:
-        preview = first_chunk.decode("utf-8", errors="ignore")
+        if not _atomic_write_bytes(target_path, first_chunk, response.raw):
+            raise RuntimeError("Ответ сервера пуст — экспорт не был сформирован.")
+    finally:
         response.close()
-        raise RuntimeError(
-            "Ожидался CSV-файл, но получен HTML документ. "
-            f"Возможна ошибка авторизации. Ответ сервера: {preview[:200]}"
+    return target_path
+
+
+def export_task(
+    session: requests.Session,
+    domain: str,
+    task: ListerExportTask,
+    output_dir: Path,
+    *,
+    config: ExportConfig,
+    label: str,
+) -> Tuple[Path, int]:
+    """Экспорт одной коллекции; при нехватке строк — одна дополнительная попытка."""
+    output_path = download_lister_csv(
+        session=session,
+        domain=domain,
+        task=task,
+        output_dir=output_dir,
+        config=config,
+    )
+    made = _count_csv_rows(output_path, config)
+    LOGGER.info(
+        "%s CSV сохранён: %s — создано %d из %d",
+        label,
+        output_path.name,
+        made,
+        task.expected_count,
+    )
+    if made < task.expected_count:
+        # одна дополнительная попытка для конкретной коллекции
+        LOGGER.info("%s Недостаёт строк (%d < %d). Повторная попытка.", label, made, task.expected_count)
+        output_path = download_lister_csv(
+            session=session,
+            domain=domain,
+            task=task,
+            output_dir=output_dir,
+            config=config,
         )
-    if not first_chunk:
-        response.close()
-        raise RuntimeError("Ответ сервера пуст — экспорт не был сформирован.")
+        made2 = _count_csv_rows(output_path, config)
+        LOGGER.info(
+            "%s Повтор завершён: %s — создано %d из %d",
+            label, output_path.name, made2, task.expected_count
+        )
+        made = max(made, made2)
+    return output_path, made
 
-    _atomic_write_bytes(target_path, first_chunk, chunk_iter)
-    response.close()
-    return target_path
+
+def export_task_shared(
+    shared: WorkerExportSessions,
+    task: ListerExportTask,
+    output_dir: Path,
+    *,
+    config: ExportConfig,
+    label: str,
+) -> Tuple[Path, int]:
+    """export_task для пула потоков: при странице логина — один повторный вход и повтор."""
+    session, domain = shared.get()
+    try:
+        return export_task(session, domain, task, output_dir, config=config, label=label)
+    except LoginRequiredError:
+        session, domain = shared.renew(session)
+        return export_task(session, domain, task, output_dir, config=config, label=label)
 
 
 def configure_logging(verbose: bool) -> logging.Logger:
@@ -481,17 +819,53 @@ def configure_logging(verbose: bool) -> logging.Logger:
     return setup_logging("exportLister", console_level=console_level)
 
 
+def _load_cached_definition(key: str) -> Optional[str]:
+    try:
+        cache = json.loads(DEFINITION_CACHE_PATH.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+    entry = cache.get(key) if isinstance(cache, dict) else None
+    if not isinstance(entry, dict):
+        return None
+    if time.time() - float(entry.get("ts") or 0) > DEFINITION_CACHE_TTL:
+        return None
+    value = entry.get("definition_id")
+    return str(value) if value else None
+
+
+def _store_cached_definition(key: str, definition_id: str) -> None:
+    try:
+        cache = json.loads(DEFINITION_CACHE_PATH.read_text(encoding="utf-8"))
+        if not isinstance(cache, dict):
+            cache = {}
+    except (OSError, ValueError):
+        cache = {}
+    cache[key] = {"definition_id": definition_id, "ts": time.time()}
+    try:
+        DEFINITION_CACHE_PATH.parent.mkdir(parents=True, exist_ok=True)
+        DEFINITION_CACHE_PATH.write_text(json.dumps(cache, ensure_ascii=False, indent=2), encoding="utf-8")
+    except OSError as exc:
+        LOGGER.debug("Не удалось сохранить кэш definition %s: %s", DEFINITION_CACHE_PATH, exc)
+
+
 def resolve_export_config(
     session: requests.Session,
     domain: str,
     *,
+    account: str,
     definition_override: Optional[str],
     export_format_override: Optional[str],
     export_encoding: Optional[str],
     expprod: Optional[str],
+    refresh_definition: bool = False,
 ) -> ExportConfig:
+    cache_key = f"{account}|{domain}"
+    cached = None if (definition_override or refresh_definition) else _load_cached_definition(cache_key)
     if definition_override:
         definition_id = definition_override
+    elif cached:
+        LOGGER.debug("[%s] definition=%s взят из кэша %s", account, cached, DEFINITION_CACHE_PATH)
+        definition_id = cached
     else:
         detected = detect_lister_definition(session, domain)
         if not detected:
@@ -502,6 +876,7 @@ def resolve_export_config(
             definition_id = DEFAULT_EXPORT_DEFINITION
         else:
             definition_id = detected
+            _store_cached_definition(cache_key, detected)
     export_format_id = export_format_override or definition_id or DEFAULT_EXPORT_FORMAT_ID
     encoding_value = export_encoding or DEFAULT_EXPORT_ENCODING
     return ExportConfig(
@@ -524,12 +899,16 @@ def parse_args() -> argparse.Namespace:
     parser.add_argument("--dry-run", action="store_true")
     parser.add_argument("--verbose", action="store_true")
     parser.add_argument("--definition-id", default=None)
+    parser.add_argument("--refresh-definitions", action="store_true")
     parser.add_argument("--export-format-id", default=None)
     parser.add_argument("--expprod", default=DEFAULT_EXPPROD)
     parser.add_argument("--export-encoding", default=DEFAULT_EXPORT_ENCODING)
+    parser.add_argument("--workers", type=int, default=EXPORT_WORKERS)
     args = parser.parse_args()
     if args.skip_existing and args.refresh_existing:
         parser.error("Нельзя одновременно использовать --skip-existing и --refresh-existing.")
+    if args.workers < 1:
+        parser.error("--workers должен быть не меньше 1.")
     return args
 
 
@@ -564,16 +943,19 @@ def main() -> None:
             continue
 
         session: Optional[requests.Session] = None
+        shared: Optional[WorkerExportSessions] = None
         try:
-            session, domain = ensure_authenticated_session(account)
+            session, domain = open_export_session(account)
 
             export_config = resolve_export_config(
                 session,
                 domain,
+                account=account,
                 definition_override=args.definition_id,
                 export_format_override=args.export_format_id,
                 export_encoding=args.export_encoding,
                 expprod=args.expprod,
+                refresh_definition=args.refresh_definitions,
             )
             if args.verbose:
                 LOGGER.debug(
@@ -589,8 +971,10 @@ def main() -> None:
             failed_tasks: List[ListerExportTask] = []
             succeeded = 0
 
+            existing_names = list_existing_exports(account_output_dir)
+            pending: List[Tuple[int, ListerExportTask]] = []
             for index, task in enumerate(tasks, start=1):
-                existing = find_existing_export(account_output_dir, task)
+                existing = find_existing_export(account_output_dir, task, existing_names)
                 if existing and args.skip_existing:
                     LOGGER.info(
                         "[%s %d/%d] Пропуск: CSV уже существует (%s).",
@@ -609,85 +993,63 @@ def main() -> None:
                         existing,
                     )
                     cleanup_existing_outputs(account, existing)
-
-                LOGGER.info(
-                    "[%s %d/%d] Экспорт коллекции %s (%s) — %d товаров.",
-                    account,
-                    index,
-                    total,
-                    task.factory_name or "<без названия>",
-                    task.factory_id,
-                    len(task.item_ids),
-                )
-                try:
-                    output_path = download_lister_csv(
-                        session=session,
-                        domain=domain,
-                        task=task,
-                        output_dir=account_output_dir,
-                        config=export_config,
-                    )
-                    made = _count_csv_rows(output_path)
-                    made2 = made
+                pending.append((index, task))
+
+            # экспорты независимы по коллекциям — параллелим ожидание генерации CSV на сервере
+            workers = max(1, min(args.workers, len(pending)))
+            shared = WorkerExportSessions(account, domain)
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                future_to_task = {}
+                for index, task in pending:
                     LOGGER.info(
-                        "[%s %d/%d] CSV сохранён: %s — создано %d из %d",
+                        "[%s %d/%d] Экспорт коллекции %s (%s) — %d товаров.",
                         account,
                         index,
                         total,
-                        output_path.name,
-                        made,
-                        task.expected_count,
+                        task.factory_name or "<без названия>",
+                        task.factory_id,
+                        len(task.item_ids),
                     )
-                    if made < task.expected_count:
-                        # одна дополнительная попытка для конкретной коллекции
-                        LOGGER.info(
-                            "[%s %d/%d] Недостаёт строк (%d < %d). Повторная попытка.",
-                            account, index, total, made, task.expected_count
-                        )
-                        output_path = download_lister_csv(
-                            session=session,
-                            domain=domain,
-                            task=task,
-                            output_dir=account_output_dir,
-                            config=export_config,
+                    future = executor.submit(
+                        export_task_shared,
+                        shared,
+                        task=task,
+                        output_dir=account_output_dir,
+                        config=export_config,
+                        label=f"[{account} {index}/{total}]",
+                    )
+                    future_to_task[future] = (index, task)
+
+                for future in as_completed(future_to_task):
+                    index, task = future_to_task[future]
+                    try:
+                        _, made = future.result()
+                    except Timeout:
+                        LOGGER.warning(
+                            "[%s %d/%d] Timeout �?� ��?���?�?�'��. �?�?�'�?�?������Ő�? �?� �����?�?���� �?� �������� ��� final-pass...",
+                            account,
+                            index,
+                            total,
                         )
-                        made2 = _count_csv_rows(output_path)
-                        LOGGER.info(
-                            "[%s %d/%d] Повтор завершён: %s — создано %d из %d",
-                            account, index, total, output_path.name, made2, task.expected_count
+                        failed_tasks.append(task)
+                        continue
+                    except Exception as exc:  # noqa: BLE001
+                        LOGGER.error(
+                            "[%s %d/%d] Ошибка при экспорте %s (%s): %s",
+                            account,
+                            index,
+                            total,
+                            task.factory_name or "<без названия>",
+                            task.factory_id,
+                            exc,
                         )
+                        failed_tasks.append(task)
+                        continue
                     # success/failure accounting for main pass
-                    if made >= task.expected_count or made2 >= task.expected_count:
+                    if made >= task.expected_count:
                         succeeded += 1
                     else:
                         failed_tasks.append(task)
-                except Timeout:
-                    LOGGER.warning(
-                        "[%s %d/%d] Timeout �?� ��?���?�?�'��. �?�?�'�?�?������Ő�? �?� �����?�?���� �?� �������� ��� final-pass...",
-                        account,
-                        index,
-                        total,
-                    )
-                    try:
-                        if session is not None:
-                            session.close()
-                    except Exception:
-                        pass
-                    session, domain = ensure_authenticated_session(account)
-                    failed_tasks.append(task)
-                    continue
-                except Exception as exc:  # noqa: BLE001
-                    LOGGER.error(
-                        "[%s %d/%d] Ошибка при экспорте %s (%s): %s",
-                        account,
-                        index,
-                        total,
-                        task.factory_name or "<без названия>",
-                        task.factory_id,
-                        exc,
-                    )
-                    failed_tasks.append(task)
-                    continue
             # Final retry pass for failures
             if failed_tasks:
                 LOGGER.info(
@@ -701,7 +1063,7 @@ def main() -> None:
                         session.close()
                 except Exception:
                     pass
-                session, domain = ensure_authenticated_session(account)
+                session, domain = open_export_session(account)
 
                 still_failed: List[ListerExportTask] = []
                 for task in failed_tasks:
@@ -713,7 +1075,7 @@ def main() -> None:
                             output_dir=account_output_dir,
                             config=export_config,
                         )
-                        made = _count_csv_rows(output_path)
+                        made = _count_csv_rows(output_path, export_config)
                         if made < task.expected_count:
                             # one more attempt
                             output_path = download_lister_csv(
@@ -723,7 +1085,7 @@ def main() -> None:
                                 output_dir=account_output_dir,
                                 config=export_config,
                             )
-                            made = _count_csv_rows(output_path)
+                            made = _count_csv_rows(output_path, export_config)
                         if made >= task.expected_count:
                             succeeded += 1
                             LOGGER.info(
@@ -773,6 +1135,8 @@ def main() -> None:
             LOGGER.error("Не удалось подготовить авторизованную сессию для аккаунта %s: %s", account, exc)
             continue
         finally:
+            if shared is not None:
+                shared.close()
             if session is not None:
                 try:
                     session.close()
@@ -3,23 +3,55 @@
 from __future__ import annotations
 
 import argparse
+import functools
 import json
+import os
 import sys
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Set, Tuple
+
+try:
+    import orjson  # type: ignore
+except ImportError:  # optional: fall back to stdlib json
+    orjson = None
+
+try:
+    import ijson  # type: ignore
+except ImportError:  # optional: large files are then parsed in one go
+    ijson = None
+
+from json_utils import atomic_write_json
 
 BASE_DIR = Path(__file__).resolve().parent
 READY_ROOT = BASE_DIR / "readyJSON"
 COLLECTIONS_ROOT = BASE_DIR / "Fabriks"
+SCAN_CACHE_ROOT = BASE_DIR / ".cache" / "ean"
 ACCOUNTS = ("JV", "XL")
 DEFAULT_FORMAT = "text"
 FORMATS = ("text", "json", "csv")
+# ready files above this size are streamed item by item (needs ijson)
+STREAM_PARSE_MIN_BYTES = 32 * 1024 * 1024
+EXTRACT_WORKERS = 8
 
 
 class FactoryLookupError(RuntimeError):
     pass
 
 
+def _load_json(path: Path) -> Any:
+    """Parse a JSON file; orjson errors subclass json.JSONDecodeError, so callers catch one type."""
+    if orjson is not None:
+        return orjson.loads(path.read_bytes())
+    return json.loads(path.read_text(encoding="utf-8"))
+
+
+@functools.lru_cache(maxsize=4096)
+def _fold(text: str) -> str:
+    """casefold() memoized per string, bounded: the Site process imports this module and lives long."""
+    return text.casefold()
+
+
 def normalize_account(value: str) -> str:
     account = value.upper()
     if account not in ACCOUNTS:
@@ -32,7 +64,7 @@ def load_collections(account: str) -> Dict[str, str]:
     if not path.exists():
         raise FileNotFoundError(f"Collections file not found: {path}")
     try:
-        raw = json.loads(path.read_text(encoding="utf-8"))
+        raw = _load_json(path)
     except json.JSONDecodeError as exc:
         raise ValueError(f"Failed to parse {path}: {exc}") from exc
     collections: Dict[str, str] = {}
@@ -48,18 +80,24 @@ def build_ready_index(account: str) -> Dict[str, List[Path]]:
     ready_dir = READY_ROOT / account
     if not ready_dir.exists():
         return {}
-    mapping: Dict[str, List[Path]] = {}
-    for path in ready_dir.glob("*.json"):
-        stem = path.stem
-        if "_" not in stem:
-            continue
-        factory_id = stem.rsplit("_", 1)[-1]
-        if not factory_id:
-            continue
-        mapping.setdefault(factory_id, []).append(path)
-    for paths in mapping.values():
-        paths.sort()
-    return mapping
+    names_by_factory: Dict[str, List[str]] = {}
+    # scandir gives the entry type from the directory read itself, no Path/stat per file
+    with os.scandir(ready_dir) as entries:
+        for entry in entries:
+            name = entry.name
+            if not name.endswith(".json") or not entry.is_file():
+                continue
+            stem = name[: -len(".json")]
+            if "_" not in stem:
+                continue
+            factory_id = stem.rsplit("_", 1)[-1]
+            if not factory_id:
+                continue
+            names_by_factory.setdefault(factory_id, []).append(name)
+    return {
+        factory_id: [ready_dir / name for name in sorted(names)]
+        for factory_id, names in names_by_factory.items()
+    }
 
 
 def list_factories(
@@ -70,8 +108,8 @@ def list_factories(
 ) -> None:
     rows: List[Tuple[str, str, bool]] = []
     term = search.casefold() if search else None
-    for factory_id, name in sorted(collections.items(), key=lambda item: item[1].casefold()):
-        if term and term not in factory_id.casefold() and term not in name.casefold():
+    for factory_id, name in sorted(collections.items(), key=lambda item: _fold(item[1])):
+        if term and term not in _fold(factory_id) and term not in _fold(name):
             continue
         rows.append((factory_id, name, factory_id in ready_index))
 
@@ -79,11 +117,13 @@ def list_factories(
         print("Нет фабрик, подходящих под критерии.", file=sys.stderr)
         return
 
-    print(f"[{account}] Доступные фабрики (✓ — есть JSON в readyJSON/{account}):")
     width = max(len(row[0]) for row in rows)
-    for factory_id, name, has_ready in rows:
-        marker = "✓" if has_ready else " "
-        print(f" {marker} {factory_id.rjust(width)}  {name}")
+    out_lines = [f"[{account}] Доступные фабрики (✓ — есть JSON в readyJSON/{account}):"]
+    out_lines.extend(
+        f" {'✓' if has_ready else ' '} {factory_id.rjust(width)}  {name}"
+        for factory_id, name, has_ready in rows
+    )
+    sys.stdout.write("\n".join(out_lines) + "\n")
 
 
 def resolve_factory(
@@ -101,14 +141,14 @@ def resolve_factory(
         raise FactoryLookupError("Factory id or name must be provided.")
 
     name_query = factory_name.strip().casefold()
-    exact_matches = [(fid, fname) for fid, fname in collections.items() if fname.casefold() == name_query]
+    exact_matches = [(fid, fname) for fid, fname in collections.items() if _fold(fname) == name_query]
     if len(exact_matches) == 1:
         return exact_matches[0]
 
     partial_matches = [
         (fid, fname)
         for fid, fname in collections.items()
-        if name_query in fname.casefold() or name_query in fid.casefold()
+        if name_query in _fold(fname) or name_query in _fold(fid)
     ]
     if len(partial_matches) == 1:
         return partial_matches[0]
@@ -120,45 +160,178 @@ def resolve_factory(
     )
 
 
+def _stream_ready_items(path: Path) -> Iterator[Any]:
+    with path.open("rb") as handle:
+        try:
+            yield from ijson.items(handle, "item", use_float=True)
+        except ijson.JSONError as exc:
+            raise ValueError(f"Failed to parse {path}: {exc}") from exc
+
+
+def _starts_with_list(path: Path) -> bool:
+    with path.open("rb") as handle:
+        return handle.read(4096).lstrip()[:1] == b"["
+
+
+def _ready_items(path: Path) -> Iterable[Any]:
+    """Items of a ready JSON list: the parsed list, or a lazy stream for big files (needs ijson)."""
+    if ijson is not None and path.stat().st_size >= STREAM_PARSE_MIN_BYTES and _starts_with_list(path):
+        return _stream_ready_items(path)
+    try:
+        payload = _load_json(path)
+    except json.JSONDecodeError as exc:
+        raise ValueError(f"Failed to parse {path}: {exc}") from exc
+    if not isinstance(payload, list):
+        raise ValueError(f"Unexpected JSON structure in {path}: expected list.")
+    return payload
+
+
+def _scan_ready_file(path: Path, include_empty: bool) -> Tuple[List[str], int, int, List[str]]:
+    """Collect the non-blank EANs of one file in order, without cross-file dedupe."""
+    items = _ready_items(path)
+    if not include_empty and isinstance(items, list):
+        # no per-row bookkeeping needed: two comprehensions instead of the branchy loop
+        values = [
+            str(raw).strip()
+            for raw in (item.get("ean") if isinstance(item, dict) else None for item in items)
+            if raw is not None
+        ]
+        eans = [ean for ean in values if ean]
+        return eans, len(items), len(items) - len(eans), []
+
+    eans = []
+    empties = 0
+    empty_details: List[str] = []
+    total = 0
+    for idx, item in enumerate(items, start=1):
+        total += 1
+        ean_raw = item.get("ean") if isinstance(item, dict) else None
+        if ean_raw is None:
+            empties += 1
+            if include_empty:
+                empty_details.append(f"{path.name}:{idx}")
+            continue
+        ean = str(ean_raw).strip()
+        if not ean:
+            empties += 1
+            if include_empty:
+                empty_details.append(f"{path.name}:{idx}")
+            continue
+        eans.append(ean)
+    return eans, total, empties, empty_details
+
+
+def scan_cache_dir(account: str) -> Path:
+    """Per-account directory of scan results, one entry per ready file, keyed by (mtime_ns, size)."""
+    return SCAN_CACHE_ROOT / account
+
+
+def _read_scan_entry(entry_path: Path) -> Optional[Dict[str, Any]]:
+    try:
+        data = _load_json(entry_path)
+    except (OSError, ValueError):
+        return None
+    return data if isinstance(data, dict) else None
+
+
+def _write_scan_entry(entry_path: Path, entry: Dict[str, Any]) -> None:
+    # one file per ready file: concurrent writers never rewrite each other's entries
+    try:
+        atomic_write_json(entry_path, entry)
+    except OSError:
+        pass  # the cache is only an optimisation
+
+
+def _prune_scan_cache(cache_dir: Path, source_dirs: Iterable[Path]) -> None:
+    """Drop entries whose ready file no longer exists (deleted or renamed)."""
+    live: Set[str] = set()
+    for source_dir in source_dirs:
+        try:
+            with os.scandir(source_dir) as entries:
+                live.update(entry.name for entry in entries)
+        except OSError:
+            return  # can't tell what is live; keep everything
+    try:
+        with os.scandir(cache_dir) as entries:
+            stale = [entry.path for entry in entries if entry.name not in live]
+    except OSError:
+        return
+    for path in stale:
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+
+
 def extract_eans(
     paths: Sequence[Path],
     *,
     dedupe: bool = True,
     include_empty: bool = False,
+    cache_dir: Optional[Path] = None,
 ) -> Tuple[List[str], int, int, List[str]]:
-    seen: set[str] = set()
+    # insertion-ordered dict doubles as the dedupe set and the result order
+    seen: Dict[str, None] = {}
     eans: List[str] = []
     empties = 0
     empty_details: List[str] = []
     total = 0
 
-    for path in paths:
-        try:
-            payload = json.loads(path.read_text(encoding="utf-8"))
-        except json.JSONDecodeError as exc:
-            raise ValueError(f"Failed to parse {path}: {exc}") from exc
-        if not isinstance(payload, list):
-            raise ValueError(f"Unexpected JSON structure in {path}: expected list.")
-        for idx, item in enumerate(payload, start=1):
-            total += 1
-            ean_raw = item.get("ean") if isinstance(item, dict) else None
-            if ean_raw is None:
-                empties += 1
-                if include_empty:
-                    empty_details.append(f"{path.name}:{idx}")
+    scans: List[Any] = [None] * len(paths)
+    signatures: Dict[int, List[int]] = {}
+    misses: List[int] = []
+    for position, path in enumerate(paths):
+        if cache_dir is not None:
+            stat = path.stat()
+            signature = [stat.st_mtime_ns, stat.st_size]
+            signatures[position] = signature
+            entry = _read_scan_entry(cache_dir / path.name)
+            if (
+                isinstance(entry, dict)
+                and entry.get("sig") == signature
+                and (not include_empty or entry.get("details") is not None)
+            ):
+                details = entry["details"] if include_empty else []
+                scans[position] = (entry["eans"], entry["total"], entry["empties"], details)
                 continue
-            ean = str(ean_raw).strip()
-            if not ean:
-                empties += 1
-                if include_empty:
-                    empty_details.append(f"{path.name}:{idx}")
-                continue
-            if dedupe:
-                if ean in seen:
-                    continue
-                seen.add(ean)
-            eans.append(ean)
+        misses.append(position)
 
+    miss_paths = [paths[position] for position in misses]
+    if len(miss_paths) > 1:
+        # files are parsed concurrently; map keeps path order so dedupe keeps first occurrences
+        with ThreadPoolExecutor(max_workers=min(EXTRACT_WORKERS, len(miss_paths))) as executor:
+            parsed = list(executor.map(lambda path: _scan_ready_file(path, include_empty), miss_paths))
+    else:
+        parsed = [_scan_ready_file(path, include_empty) for path in miss_paths]
+    for position, result in zip(misses, parsed):
+        scans[position] = result
+        if cache_dir is not None:
+            file_eans, file_total, file_empties, file_details = result
+            _write_scan_entry(
+                cache_dir / paths[position].name,
+                {
+                    "sig": signatures[position],
+                    "eans": file_eans,
+                    "total": file_total,
+                    "empties": file_empties,
+                    "details": file_details if include_empty else None,
+                },
+            )
+    if cache_dir is not None and misses:
+        # a miss usually means ready files were regenerated: clear entries of vanished files
+        _prune_scan_cache(cache_dir, {path.parent for path in paths})
+
+    for file_eans, file_total, file_empties, file_details in scans:
+        total += file_total
+        empties += file_empties
+        empty_details.extend(file_details)
+        if dedupe:
+            seen.update(dict.fromkeys(file_eans))
+        else:
+            eans.extend(file_eans)
+
+    if dedupe:
+        eans = list(seen)
     return eans, total, empties, empty_details
 
 
@@ -174,12 +347,9 @@ def format_output(
     empty_count: int,
     empty_details: Sequence[str],
 ) -> str:
-    relative_sources: List[str] = []
-    for path in source_files:
-        try:
-            relative_sources.append(str(path.relative_to(BASE_DIR)))
-        except ValueError:
-            relative_sources.append(str(path))
+    # one string prefix strip per file instead of Path.relative_to + exception for outsiders
+    base_prefix = str(BASE_DIR) + os.sep
+    relative_sources = [str(path).removeprefix(base_prefix) for path in source_files]
     if output_format == "json":
         payload = {
             "account": account,
@@ -193,6 +363,8 @@ def format_output(
         }
         if empty_details:
             payload["blank_entries"] = list(empty_details)
+        if orjson is not None:
+            return orjson.dumps(payload, option=orjson.OPT_INDENT_2).decode("utf-8")
         return json.dumps(payload, ensure_ascii=False, indent=2)
     if output_format == "csv":
         lines = ["ean"]
@@ -299,6 +471,7 @@ def main(argv: Optional[Sequence[str]] = None) -> int:
             source_files,
             dedupe=args.dedupe,
             include_empty=args.include_empty,
+            cache_dir=scan_cache_dir(args.account),
         )
     except ValueError as exc:
         print(exc, file=sys.stderr)
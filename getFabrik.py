@@ -1,14 +1,28 @@
 import argparse
+import functools
 import html
 import json
 import logging
+import re
 import sys
 from concurrent.futures import ThreadPoolExecutor, as_completed
-from html.parser import HTMLParser
 from pathlib import Path
-from typing import Dict, List, Optional, Sequence, Tuple
+from typing import Dict, Iterator, List, Sequence, Tuple
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.request import ACCEPT_ENCODING
+from urllib3.util.retry import Retry
+
+try:
+    import orjson  # type: ignore
+except ImportError:  # optional: stdlib json is used instead
+    orjson = None
+
+try:
+    import lxml.html  # type: ignore
+except ImportError:  # optional: the regex scanner below is used instead
+    lxml = None
 
 from logging_utils import setup_logging, get_logger
 
@@ -48,6 +62,16 @@ LISTER_OUTPUTS = {
 }
 TARGET_CHOICES = ("catalog", "lister", "all")
 LOG_DIR = Path("LOGs")
+POOL_CONNECTIONS = 4
+POOL_MAXSIZE = 8
+# общий для всех сессий повтор GET на временных 5xx и обрывах соединения
+RETRY_POLICY = Retry(
+    total=3,
+    backoff_factor=0.5,
+    status_forcelist=(500, 502, 503, 504),
+    allowed_methods=frozenset({"GET"}),
+    raise_on_status=False,  # после исчерпания отдаём последний ответ: статус проверяет вызывающий код
+)
 
 LOGGER = logging.getLogger("getFabrik")
 
@@ -57,94 +81,62 @@ def configure_logging(verbose: bool) -> logging.Logger:
     return setup_logging("getFabrik", console_level=console_level)
 
 
-class OptionCollector(HTMLParser):
-    """Collect <option> tags from an HTML fragment."""
-
-    def __init__(self) -> None:
-        super().__init__()
-        self._collecting = False
-        self._current_value: Optional[str] = None
-        self._buffer: List[str] = []
-        self.options: List[Tuple[str, str]] = []
-
-    def handle_starttag(self, tag: str, attrs: List[Tuple[str, Optional[str]]]) -> None:
-        if tag.lower() != "option":
-            return
-        self._collecting = True
-        self._buffer.clear()
-        self._current_value = None
-        for key, value in attrs:
-            if key.lower() == "value":
-                self._current_value = value or ""
-
-    def handle_data(self, data: str) -> None:
-        if self._collecting:
-            self._buffer.append(data)
-
-    def handle_endtag(self, tag: str) -> None:
-        if tag.lower() != "option":
-            return
-        if self._current_value is not None:
-            text = html.unescape("".join(self._buffer).strip())
-            value = html.unescape(self._current_value.strip())
-            self.options.append((value, text))
-        self._buffer.clear()
-        self._current_value = None
-        self._collecting = False
-
-
-class SelectOptionParser(HTMLParser):
-    """Collect <option> values from a specific <select name=...>."""
-
-    def __init__(self, select_name: str) -> None:
-        super().__init__()
-        self.select_name = select_name
-        self._active = False
-        self._current_value: Optional[str] = None
-        self._buffer: List[str] = []
-        self.options: List[Tuple[str, str]] = []
-
-    def handle_starttag(
-        self, tag: str, attrs: List[Tuple[str, Optional[str]]]
-    ) -> None:
-        tag_lower = tag.lower()
-        if tag_lower == "select":
-            attr_dict = {k.lower(): (v or "") for k, v in attrs}
-            if attr_dict.get("name") == self.select_name:
-                self._active = True
-            return
-        if not self._active or tag_lower != "option":
-            return
-        self._current_value = None
-        self._buffer.clear()
-        for key, value in attrs:
-            if key.lower() == "value":
-                self._current_value = value or ""
-
-    def handle_data(self, data: str) -> None:
-        if self._active and self._current_value is not None:
-            self._buffer.append(data)
-
-    def handle_endtag(self, tag: str) -> None:
-        tag_lower = tag.lower()
-        if tag_lower == "select":
-            self._active = False
-            return
-        if not self._active or tag_lower != "option":
-            return
-        if self._current_value is not None:
-            text = html.unescape("".join(self._buffer).strip())
-            value = html.unescape(self._current_value.strip())
-            self.options.append((value, text))
-        self._buffer.clear()
-        self._current_value = None
-
-
-def parse_catalog_factories(html_fragment: str) -> List[Dict[str, str]]:
-    parser = OptionCollector()
-    parser.feed(html_fragment)
+# <option value=...>label</option>; label may hold inline tags, but not another <option>
+OPTION_RE = re.compile(
+    rb"<option\b(?P<attrs>[^>]*)>(?P<label>[^<]*(?:<(?!/?option\b)[^<]*)*)</option\s*>",
+    re.IGNORECASE,
+)
+VALUE_ATTR_RE = re.compile(
+    rb"""\bvalue\s*=\s*(?:"(?P<dq>[^"]*)"|'(?P<sq>[^']*)'|(?P<bare>[^\s>]+))""",
+    re.IGNORECASE,
+)
+TAG_RE = re.compile(rb"<[^>]*>")
+# маркеры страницы логина ищем в сырых байтах: без декодирования и копии .lower() всего ответа
+SIGNIN_RE = re.compile(rb"form-signin", re.IGNORECASE)
+# любой из признаков неавторизованной сессии — один проход по телу ответа
+UNAUTHENTICATED_RE = re.compile(rb'form-signin|name="hiddenform"|<title>working', re.IGNORECASE)
+LISTER_SELECT_RE = re.compile(
+    rb"<select\b[^>]*\bname\s*=\s*([\"']?)"
+    + re.escape(LISTER_SELECT_NAME.encode("ascii"))
+    + rb"\1(?=[\s>/])[^>]*>(?P<body>.*?)</select\s*>",
+    re.IGNORECASE | re.DOTALL,
+)
+
+
+def iter_options(content: bytes, encoding: str = "utf-8") -> Iterator[Tuple[str, str]]:
+    """(value, label) of every <option> carrying a value attribute, entities unescaped."""
+    for match in OPTION_RE.finditer(content):
+        value_match = VALUE_ATTR_RE.search(match.group("attrs"))
+        if not value_match:
+            continue
+        raw_value = value_match.group("dq") or value_match.group("sq") or value_match.group("bare") or b""
+        raw_label = match.group("label")
+        if b"<" in raw_label:
+            raw_label = TAG_RE.sub(b"", raw_label)
+        value = html.unescape(raw_value.decode(encoding, errors="replace").strip())
+        label = html.unescape(raw_label.decode(encoding, errors="replace").strip())
+        yield value, label
+
+
+def iter_options_lxml(
+    content: bytes, encoding: str, xpath: str, **variables: str
+) -> Iterator[Tuple[str, str]]:
+    """Same as iter_options, but libxml2 builds the tree; tolerant of broken markup."""
+    if not content.strip():
+        return
+    parser = lxml.html.HTMLParser(encoding=encoding)
+    tree = lxml.html.fromstring(content, parser=parser)
+    for option in tree.xpath(xpath, **variables):
+        yield (option.get("value") or "").strip(), option.text_content().strip()
+
+
+def parse_catalog_factories(html_fragment: bytes, encoding: str = "utf-8") -> List[Dict[str, str]]:
+    if lxml is not None:
+        options = iter_options_lxml(html_fragment, encoding, "//option[@value]")
+    else:
+        options = iter_options(html_fragment, encoding)
     factories: List[Dict[str, str]] = []
-    for value, raw_text in parser.options:
+    for value, raw_text in options:
         stripped = value.strip()
         if not stripped.isdigit():
             continue
@@ -157,27 +149,52 @@ def parse_catalog_factories(html_fragment: str) -> List[Dict[str, str]]:
     return factories
 
 
-def parse_lister_collections(page_html: str) -> List[Dict[str, str]]:
-    parser = SelectOptionParser(LISTER_SELECT_NAME)
-    parser.feed(page_html)
+def parse_lister_collections(page_html: bytes, encoding: str = "utf-8") -> List[Dict[str, str]]:
+    if lxml is not None:
+        options = iter_options_lxml(
+            page_html, encoding, "//select[@name=$name]/option[@value]", name=LISTER_SELECT_NAME
+        )
+    else:
+        options = (
+            option
+            for select_match in LISTER_SELECT_RE.finditer(page_html)
+            for option in iter_options(select_match.group("body"), encoding)
+        )
     collections: List[Dict[str, str]] = []
-    for value, label in parser.options:
+    for value, label in options:
         if value in {"0", "-1"}:
             continue
         collections.append({"id": value, "name": label})
     return collections
 
 
-def load_cookies(session: requests.Session, cookies_path: Path) -> None:
-    data = json.loads(cookies_path.read_text(encoding="utf-8"))
-    for cookie in data:
-        session.cookies.set(
+@functools.lru_cache(maxsize=8)
+def _read_cookie_file(cookies_path: str, mtime_ns: int) -> Tuple[Tuple[str, str, str, str, bool], ...]:
+    # mtime_ns входит в ключ кэша: перезаписанный файл cookies перечитывается
+    raw = Path(cookies_path).read_bytes()
+    data = orjson.loads(raw) if orjson is not None else json.loads(raw)
+    return tuple(
+        (
             cookie["name"],
             cookie["value"],
-            domain=cookie.get("domain"),
-            path=cookie.get("path") or "/",
-            secure=cookie.get("secure", False),
+            cookie.get("domain") or "",
+            cookie.get("path") or "/",
+            bool(cookie.get("secure", False)),
+        )
+        for cookie in data
+    )
+
+
+def load_cookies(session: requests.Session, cookies_path: Path) -> None:
+    # jar собирается целиком и назначается один раз, без поиска дублей на каждый set()
+    jar = requests.cookies.RequestsCookieJar()
+    for name, value, domain, path, secure in _read_cookie_file(
+        str(cookies_path), cookies_path.stat().st_mtime_ns
+    ):
+        jar.set_cookie(
+            requests.cookies.create_cookie(name, value, domain=domain, path=path, secure=secure)
         )
+    session.cookies = jar
 
 
 def validate_session(session: requests.Session, domain: str) -> bool:
@@ -185,14 +202,17 @@ def validate_session(session: requests.Session, domain: str) -> bool:
     response = session.get(url, timeout=30)
     if response.status_code != 200:
         return False
-    content = response.text.lower()
-    if "form-signin" in content:
-        return False
-    if 'name="hiddenform"' in content:
-        return False
-    if "<title>working" in content:
-        return False
-    return True
+    return UNAUTHENTICATED_RE.search(response.content) is None
+
+
+def configure_session(session: requests.Session) -> requests.Session:
+    """Keep-alive pool per host, GET retries on transient errors and every content coding urllib3 can decode."""
+    session.mount(
+        "https://",
+        HTTPAdapter(pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE, max_retries=RETRY_POLICY),
+    )
+    session.headers["Accept-Encoding"] = ACCEPT_ENCODING
+    return session
 
 
 def ensure_authenticated_session(account: str) -> Tuple[requests.Session, str]:
@@ -201,7 +221,7 @@ def ensure_authenticated_session(account: str) -> Tuple[requests.Session, str]:
         raise ValueError(f"Unknown account '{account}'.")
     domain = ACCOUNT_DOMAINS[key]
 
-    session = requests.Session()
+    session = configure_session(requests.Session())
     session.headers.update({"User-Agent": USER_AGENT})
 
     cookies_file = SESSION_DIR / f"{key.lower()}_cookies.json"
@@ -212,17 +232,23 @@ def ensure_authenticated_session(account: str) -> Tuple[requests.Session, str]:
 
     creds = get_credentials(key)
     client = AfterbuyClient(creds["login"], creds["password"], domain)
-    session = client.login()
+    session = configure_session(client.login())
     save_cookies(key, session)
     return session, domain
 
 
+@functools.lru_cache(maxsize=4)
+def _load_accounts(env_path: str, mtime_ns: int) -> Dict[str, Dict[str, str]]:
+    # mtime_ns входит в ключ кэша: изменённый .env перечитывается
+    return extract_accounts(read_env_file(Path(env_path)))
+
+
 def get_credentials(account: str) -> Dict[str, str]:
-    env = read_env_file(Path(".env"))
-    accounts = extract_accounts(env)
+    env_path = Path(".env").resolve()
+    accounts = _load_accounts(str(env_path), env_path.stat().st_mtime_ns)
     if account not in accounts:
         raise ValueError(f"Credentials for '{account}' not found in .env.")
-    return accounts[account]
+    return dict(accounts[account])
 
 
 def fetch_catalog_factories(session: requests.Session, domain: str) -> List[Dict[str, str]]:
@@ -234,9 +260,9 @@ def fetch_catalog_factories(session: requests.Session, domain: str) -> List[Dict
     }
     response = session.get(url, params=CATALOG_PARAMS, headers=headers, timeout=30)
     response.raise_for_status()
-    if "form-signin" in response.text.lower():
+    if SIGNIN_RE.search(response.content):
         raise RuntimeError("Session is not authenticated; received login page.")
-    return parse_catalog_factories(response.text)
+    return parse_catalog_factories(response.content, response.encoding or "utf-8")
 
 
 def fetch_lister_collections(session: requests.Session, domain: str) -> List[Dict[str, str]]:
@@ -247,13 +273,16 @@ def fetch_lister_collections(session: requests.Session, domain: str) -> List[Dic
     }
     response = session.get(url, params=LISTER_PARAMS, headers=headers, timeout=30)
     response.raise_for_status()
-    if "form-signin" in response.text.lower():
+    if SIGNIN_RE.search(response.content):
         raise RuntimeError("Session is not authenticated; received login page.")
-    return parse_lister_collections(response.text)
+    return parse_lister_collections(response.content, response.encoding or "utf-8")
 
 
 def save_json(path: Path, payload: List[Dict[str, str]]) -> None:
     path.parent.mkdir(parents=True, exist_ok=True)
+    if orjson is not None:
+        path.write_bytes(orjson.dumps(payload, option=orjson.OPT_INDENT_2))
+        return
     path.write_text(json.dumps(payload, ensure_ascii=False, indent=2), encoding="utf-8")
 
 
@@ -262,22 +291,29 @@ def setup_logger(account: str):
     return get_logger("getFabrik", account=account)
 
 
+TARGET_FETCHERS = {
+    "catalog": (fetch_catalog_factories, CATALOG_OUTPUTS),
+    "lister": (fetch_lister_collections, LISTER_OUTPUTS),
+}
+
+
 def process_account(
     account: str, targets: Sequence[str], logger: logging.Logger
 ) -> List[Tuple[str, Path, int]]:
     session, domain = ensure_authenticated_session(account)
+    selected = [kind for kind in ("catalog", "lister") if kind in targets]
     results: List[Tuple[str, Path, int]] = []
     try:
-        if "catalog" in targets:
-            factories = fetch_catalog_factories(session, domain)
-            output_path = CATALOG_OUTPUTS[account]
-            save_json(output_path, factories)
-            results.append(("catalog", output_path, len(factories)))
-        if "lister" in targets:
-            collections = fetch_lister_collections(session, domain)
-            output_path = LISTER_OUTPUTS[account]
-            save_json(output_path, collections)
-            results.append(("lister", output_path, len(collections)))
+        # запросы каталога и листера независимы — ждём их параллельно на общей сессии
+        with ThreadPoolExecutor(max_workers=max(len(selected), 1)) as executor:
+            futures = [
+                (kind, executor.submit(TARGET_FETCHERS[kind][0], session, domain)) for kind in selected
+            ]
+            for kind, future in futures:
+                entries = future.result()
+                output_path = TARGET_FETCHERS[kind][1][account]
+                save_json(output_path, entries)
+                results.append((kind, output_path, len(entries)))
     finally:
         session.close()
     return results
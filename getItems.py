@@ -1,18 +1,35 @@
 import argparse
-import copy
+import functools
+import html
 import json
 import logging
+import pickle
 import re
+import string
 import sys
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import threading
+from urllib.parse import quote_plus, urlencode
+from concurrent.futures import Executor, ThreadPoolExecutor, as_completed
 from html.parser import HTMLParser
 from pathlib import Path
-from typing import Dict, List, Optional, Sequence, Tuple
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
 
 import requests
 
+try:
+    from selectolax.lexbor import LexborHTMLParser  # type: ignore
+except ImportError:  # optional: lxml or HiddenInputParser below is used instead
+    LexborHTMLParser = None
+
+try:
+    import lxml.html  # type: ignore
+except ImportError:  # optional: HiddenInputParser below is used instead
+    lxml = None
+
 from logging_utils import setup_logging
-from getFabrik import ACCOUNT_ORDER, ensure_authenticated_session  # type: ignore
+from env_utils import env_int
+from json_utils import atomic_write_json, dump_json, load_json
+from getFabrik import ACCOUNT_ORDER, configure_session, ensure_authenticated_session  # type: ignore
 
 
 # ===== Константы и пути =====
@@ -27,8 +44,15 @@ LISTER_OUTPUT_DIRS = {
     "XL": Path("itemsF") / "XL_I_L",
 }
 
+
 MAX_WORKERS = 5
+# запросы листера упираются в сеть, а не в CPU — число параллельных фабрик задаётся через env
+ENTITY_WORKERS = env_int("GETITEMS_WORKERS", MAX_WORKERS)
+PAGE_WORKERS = env_int("GETITEMS_PAGE_WORKERS", 4)
 LOG_DIR = Path("LOGs")
+# item_count прошлого запуска по каждой фабрике — подсказка для параллельной подгрузки страниц
+ITEM_COUNT_CACHE_DIR = Path(".cache") / "getItems"
+STREAM_CHUNK_SIZE = 64 * 1024
 
 LISTER_PATH = "/afterbuy/ebayliste2.aspx"
 
@@ -65,6 +89,13 @@ LISTER_PARAMS = {
 
 HIDDEN_INPUT_NAME = "allmyupdtids"
 
+_SANITIZE_RE = re.compile(r"[^A-Za-z0-9._-]+")
+_ALLOWED_FILENAME_CHARS = frozenset(string.ascii_letters + string.digits + "._-")
+# недопустимые ASCII-символы -> пробел; split/join затем схлопывает каждую серию в один "_"
+_SANITIZE_TABLE = str.maketrans(
+    {chr(code): " " for code in range(128) if chr(code) not in _ALLOWED_FILENAME_CHARS}
+)
+
 
 DATASETS: Dict[str, Dict[str, object]] = {
     "lister": {
@@ -136,34 +167,96 @@ class HiddenInputParser(HTMLParser):
             self.value = attr_map.get("value", "")
 
 
-# ===== Вспомогательные функции =====
+HIDDEN_VALUE_RE = re.compile(
+    rb"""(?<![\w-])value\s*=\s*(?:"(?P<dq>[^"]*)"|'(?P<sq>[^']*)'|(?P<bare>[^\s>]+))""",
+    re.IGNORECASE,
+)
 
-def clone_cookie_jar(
-    jar: requests.cookies.RequestsCookieJar,
-) -> requests.cookies.RequestsCookieJar:
-    cloned = requests.cookies.RequestsCookieJar()
-    for cookie in jar:
-        cloned.set_cookie(copy.copy(cookie))
-    return cloned
 
+@functools.lru_cache(maxsize=8)
+def _hidden_input_re(target_name: str) -> "re.Pattern[bytes]":
+    # атрибут name может стоять до или после value — проверяем его lookahead'ом внутри тега
+    return re.compile(
+        rb"<input\b(?=[^>]*(?<![\w-])name\s*=\s*([\"']?)"
+        + re.escape(target_name.encode("ascii"))
+        + rb"\1(?=[\s>/]))(?P<attrs>[^>]*)>",
+        re.IGNORECASE,
+    )
+
+
+def _hidden_raw(attrs: bytes) -> bytes:
+    value_match = HIDDEN_VALUE_RE.search(attrs)
+    if not value_match:
+        return b""
+    return bytes(value_match.group("dq") or value_match.group("sq") or value_match.group("bare") or b"")
+
+
+def _hidden_value(attrs: bytes, encoding: str) -> str:
+    return html.unescape(_hidden_raw(attrs).decode(encoding, errors="replace"))
+
+
+def extract_hidden_value(content: bytes, encoding: str, target_name: str) -> str:
+    """Value of the first <input name=target_name>: regex on raw bytes, full parser only on a miss."""
+    match = _hidden_input_re(target_name).search(content)
+    if match:
+        return _hidden_value(match.group("attrs"), encoding)
+    LOGGER.debug("input %s не найден регуляркой, разбираем страницу целиком", target_name)
+    target = target_name.lower()
+    if LexborHTMLParser is not None:
+        tree = LexborHTMLParser(content.decode(encoding, errors="replace"))
+        for node in tree.css("input"):
+            if (node.attributes.get("name") or "").lower() == target:
+                return node.attributes.get("value") or ""
+        return ""
+    if lxml is None:
+        parser = HiddenInputParser(target_name)
+        parser.feed(content.decode(encoding, errors="replace"))
+        return parser.value or ""
+    if not content.strip():
+        return ""
+    tree = lxml.html.fromstring(content, parser=lxml.html.HTMLParser(encoding=encoding))
+    for node in tree.iter("input"):
+        if (node.get("name") or "").lower() == target:
+            return node.get("value") or ""
+    return ""
+
+
+def scan_hidden_value(response: requests.Response, target_name: str) -> bytes:
+    """Scan a streamed response for the hidden input without buffering past it; value as UTF-8 bytes."""
+    encoding = response.encoding or "utf-8"
+    pattern = _hidden_input_re(target_name)
+    buffer = bytearray()
+    start = 0
+    for chunk in response.iter_content(chunk_size=STREAM_CHUNK_SIZE):
+        buffer += chunk
+        match = pattern.search(buffer, start)
+        if match:
+            # хвост не читаем: вызывающий закрывает ответ, пул откроет новое соединение
+            raw = _hidden_raw(match.group("attrs"))
+            # список id — чистый ASCII без сущностей: отдаём байты как есть, без decode
+            if raw.isascii() and b"&" not in raw:
+                return raw
+            return _hidden_value(match.group("attrs"), encoding).encode("utf-8")
+        # незакрытый тег может начаться только после последнего '>' — старый хвост не пересматриваем
+        start = buffer.rfind(b">") + 1
+    return extract_hidden_value(bytes(buffer), encoding, target_name).encode("utf-8")
+
+
+# ===== Вспомогательные функции =====
 
 def load_entities(path: Path) -> List[Dict[str, str]]:
     if not path.exists():
         raise FileNotFoundError(f"Factory file not found: {path}")
-    data = json.loads(path.read_text(encoding="utf-8"))
+    data = load_json(path)
     if not isinstance(data, list):
         raise ValueError(f"Factory file {path} is not a list.")
 
-    result: List[Dict[str, str]] = []
-    for item in data:
-        if not isinstance(item, dict):
-            continue
-        factory_id = str(item.get("id", "")).strip()
-        name = str(item.get("name", "")).strip()
-        if not factory_id or not name:
-            continue
-        result.append({"id": factory_id, "name": name})
-    return result
+    pairs = (
+        (str(item.get("id", "")).strip(), str(item.get("name", "")).strip())
+        for item in data
+        if isinstance(item, dict)
+    )
+    return [{"id": factory_id, "name": name} for factory_id, name in pairs if factory_id and name]
 
 
 def update_entity_counts_file(
@@ -172,7 +265,7 @@ def update_entity_counts_file(
     if not updates or not path.exists():
         return
     try:
-        data = json.loads(path.read_text(encoding="utf-8"))
+        data = load_json(path)
     except (OSError, json.JSONDecodeError) as exc:
         LOGGER.warning("Не удалось обновить файл фабрик %s: %s", path, exc)
         return
@@ -207,34 +300,47 @@ def update_entity_counts_file(
         return
 
     try:
-        path.write_text(
-            json.dumps(data, ensure_ascii=False, indent=2),
-            encoding="utf-8",
-        )
+        path.write_bytes(dump_json(data))
     except OSError as exc:
         LOGGER.warning(
             "Не удалось сохранить обновлённый файл фабрик %s: %s", path, exc
         )
 
 
-def read_item_count_from_file(path: Path) -> Optional[int]:
-    if not path.exists():
-        return None
+def item_counts_path(output_root: Path) -> Path:
+    return ITEM_COUNT_CACHE_DIR / f"{output_root.name}.json"
+
+
+def read_item_counts(path: Path) -> Dict[str, int]:
     try:
-        data = json.loads(path.read_text(encoding="utf-8"))
-    except (OSError, json.JSONDecodeError):
-        return None
-    value = data.get("item_count")
-    if value is None:
-        return None
+        data = load_json(path)
+    except (OSError, ValueError):
+        return {}
+    if not isinstance(data, dict):
+        return {}
+    counts: Dict[str, int] = {}
+    for entity_id, value in data.items():
+        try:
+            counts[str(entity_id)] = int(value)
+        except (TypeError, ValueError):
+            continue
+    return counts
+
+
+def write_item_counts(path: Path, counts: Dict[str, int]) -> None:
     try:
-        return int(value)
-    except (TypeError, ValueError):
-        return None
+        atomic_write_json(path, counts)
+    except OSError as exc:
+        LOGGER.warning("Не удалось сохранить item_count в %s: %s", path, exc)
 
 
+@functools.lru_cache(maxsize=4096)
 def sanitize_filename(name: str) -> str:
-    cleaned = re.sub(r"[^A-Za-z0-9._-]+", "_", name.strip())
+    stripped = name.strip()
+    if stripped.isascii():
+        cleaned = "_".join(stripped.translate(_SANITIZE_TABLE).split())
+    else:
+        cleaned = _SANITIZE_RE.sub("_", stripped)
     cleaned = cleaned.strip("_")
     if not cleaned:
         cleaned = "factory"
@@ -254,6 +360,9 @@ def fetch_item_ids(
     offset_param: str = "rsposition",
     timeout: int = 60,
     logger: Optional[logging.Logger] = None,
+    expected_count: Optional[int] = None,
+    page_executor: Optional[Executor] = None,
+    page_session: Optional[Callable[[], requests.Session]] = None,
 ) -> List[str]:
     base_url = (
         endpoint if endpoint.startswith("http") else f"https://{domain}{endpoint}"
@@ -268,8 +377,8 @@ def fetch_item_ids(
     else:
         referer = base_url
 
-    collected: List[str] = []
-    seen: set[str] = set()
+    # dict с порядком вставки — и список id, и множество виденных в одной структуре
+    collected: Dict[bytes, None] = {}
     offset = 0
 
     # определяем размер страницы
@@ -290,31 +399,61 @@ def fetch_item_ids(
 
     headers = {"Referer": referer}
 
-    while True:
-        params = base_params.copy()
-        params[id_param] = entity_id
-        if offset:
-            params[offset_param] = str(offset)
+    # query-строка фабрики кодируется один раз; от страницы к странице меняется только offset
+    static_params = {**base_params, id_param: entity_id}
+    static_params.pop(offset_param, None)
+    entity_url = f"{base_url}?{urlencode(static_params)}"
+    offset_key = quote_plus(offset_param)
+
+    def fetch_page(page_offset: int, http: requests.Session) -> bytes:
+        url = f"{entity_url}&{offset_key}={page_offset}" if page_offset else entity_url
+
+        # stream=True: тело читается кусками, после найденного input хвост не копится в памяти
+        with http.get(
+            url, headers=headers, timeout=timeout, stream=True
+        ) as response:
+            response.raise_for_status()
+            if logger and not page_offset:
+                # Accept-Encoding выставляет configure_session (br — при установленном brotli)
+                logger.debug(
+                    "%s: Content-Encoding=%s",
+                    entity_id,
+                    response.headers.get("Content-Encoding", "identity"),
+                )
+            return scan_hidden_value(response, hidden_input).strip()
 
-        response = session.get(
-            base_url, params=params, headers=headers, timeout=timeout
-        )
-        response.raise_for_status()
+    def prefetch_page(page_offset: int) -> Optional[bytes]:
+        try:
+            # поток общего пула страниц ходит через свою сессию, а не через сессию фабрики
+            return fetch_page(page_offset, page_session())  # type: ignore[misc]
+        except requests.RequestException:
+            # страницу перезапросит последовательный цикл и сам сообщит об ошибке
+            return None
+
+    # страницы прошлого item_count запрашиваем заранее в общем пуле
+    prefetched: Dict[int, Optional[bytes]] = {}
+    if (
+        page_executor is not None
+        and page_session is not None
+        and expected_count
+        and expected_count >= page_size
+    ):
+        offsets = list(range(0, expected_count + 1, page_size))
+        prefetched = dict(zip(offsets, page_executor.map(prefetch_page, offsets)))
 
-        parser = HiddenInputParser(hidden_input)
-        parser.feed(response.text)
-        value = (parser.value or "").strip()
+    while True:
+        value = prefetched.pop(offset, None)
+        if value is None:
+            value = fetch_page(offset, session)
         if not value:
             break
 
-        page_ids = [token for token in value.split(",") if token]
+        page_ids = [token for token in value.split(b",") if token]
 
-        new_count = 0
-        for item_id in page_ids:
-            if item_id not in seen:
-                seen.add(item_id)
-                collected.append(item_id)
-                new_count += 1
+        # уже виденные id при update остаются на своих местах, новые дописываются в конец
+        before = len(collected)
+        collected.update(dict.fromkeys(page_ids))
+        new_count = len(collected) - before
 
         if logger:
             logger.debug(
@@ -330,7 +469,10 @@ def fetch_item_ids(
 
         offset += page_size
 
-    return collected
+    # id держим байтами до конца пагинации; в str — одним decode склеенного списка и split на уровне C
+    if not collected:
+        return []
+    return b",".join(collected).decode("utf-8").split(",")
 
 
 def process_entities(
@@ -338,7 +480,8 @@ def process_entities(
     entities: Sequence[Dict[str, str]],
     config: Dict[str, object],
     logger: logging.Logger,
-) -> List[Dict[str, str]]:
+) -> Dict[str, Dict[str, str]]:
+    """Fetch every entity; returns the failed ones keyed by id (already de-duplicated)."""
     # сессия / домен от afterbuy
     session, domain = ensure_authenticated_session(account)
 
@@ -349,6 +492,10 @@ def process_entities(
     count_updates: Dict[str, Tuple[str, int]] = {}
     counts_path: Optional[Path] = None
 
+    # читается один раз на запуск, а не по файлу результата на каждую фабрику
+    known_counts_path = item_counts_path(output_root)
+    known_counts = read_item_counts(known_counts_path)
+
     count_map = config.get("count_files")  # type: ignore[assignment]
     if isinstance(count_map, dict):
         count_target = count_map.get(account)
@@ -357,7 +504,8 @@ def process_entities(
 
     # сохраняем заголовки и куки чтобы потом параллелить без повторного логина
     headers_template = dict(session.headers)
-    cookies_template = clone_cookie_jar(session.cookies)
+    # снимок jar один раз: каждый поток получает свою копию одним unpickle
+    cookies_blob = pickle.dumps(session.cookies)
     session.close()
 
     dataset_label = config["label"]  # type: ignore[index]
@@ -371,34 +519,45 @@ def process_entities(
     offset_param: str = config.get("offset_param", "rsposition")  # type: ignore[arg-type]
     timeout: int = int(config.get("timeout", 60))  # type: ignore[arg-type]
 
+    # одна сессия на поток пула: keep-alive соединение переживает смену фабрики
+    worker_state = threading.local()
+    worker_sessions: List[requests.Session] = []
+
+    def worker_session() -> requests.Session:
+        local_session = getattr(worker_state, "session", None)
+        if local_session is None:
+            local_session = configure_session(requests.Session())
+            local_session.headers.update(headers_template)
+            local_session.cookies = pickle.loads(cookies_blob)
+            worker_state.session = local_session
+            worker_sessions.append(local_session)
+        return local_session
+
     def handle_entity(entity: Dict[str, str]) -> Tuple[str, str, int, Path]:
         entity_id = entity["id"]
         entity_name = entity["name"]
 
-        local_session = requests.Session()
-        local_session.headers.update(headers_template)
-        local_session.cookies = clone_cookie_jar(cookies_template)
-        try:
-            item_ids = fetch_item_ids(
-                local_session,
-                domain,
-                endpoint,
-                base_params,
-                id_param,
-                entity_id,
-                page_size_keys,
-                referer_path=referer_path,
-                hidden_input=hidden_input,
-                offset_param=offset_param,
-                timeout=timeout,
-                logger=logger,
-            )
-        finally:
-            local_session.close()
-
         safe_name = sanitize_filename(entity_name)
         output_path = output_root / f"{safe_name}_{entity_id}.json"
 
+        item_ids = fetch_item_ids(
+            worker_session(),
+            domain,
+            endpoint,
+            base_params,
+            id_param,
+            entity_id,
+            page_size_keys,
+            referer_path=referer_path,
+            hidden_input=hidden_input,
+            offset_param=offset_param,
+            timeout=timeout,
+            logger=logger,
+            expected_count=known_counts.get(entity_id),
+            page_executor=page_executor,
+            page_session=worker_session,
+        )
+
         payload = {
             "factory_id": entity_id,
             "factory_name": entity_name,
@@ -406,16 +565,18 @@ def process_entities(
             "item_ids": item_ids,
         }
 
-        output_path.write_text(
-            json.dumps(payload, ensure_ascii=False, indent=2),
-            encoding="utf-8",
-        )
+        # файл читают только программы — компактный JSON вдвое меньше
+        output_path.write_bytes(dump_json(payload, indent=False))
 
         return entity_name, entity_id, len(item_ids), output_path
 
-    failed_entities: List[Dict[str, str]] = []
+    failed_entities: Dict[str, Dict[str, str]] = {}
 
-    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+    # один пул страниц на все фабрики: одновременно не больше ENTITY_WORKERS + PAGE_WORKERS запросов,
+    # у каждого потока своя сессия из worker_session
+    with ThreadPoolExecutor(max_workers=PAGE_WORKERS) as page_executor, ThreadPoolExecutor(
+        max_workers=ENTITY_WORKERS
+    ) as executor:
         future_to_entity = {
             executor.submit(handle_entity, entity): entity for entity in entities
         }
@@ -424,33 +585,41 @@ def process_entities(
             try:
                 entity_name, entity_id, count, output_path = future.result()
 
-                stored_count = read_item_count_from_file(output_path) or count
-                count_updates[entity_id] = (entity_name, stored_count)
+                count_updates[entity_id] = (entity_name, count)
 
                 message = (
                     f"[{account}][{console_prefix}] "
                     f"{entity_name} ({entity_id}) -> "
-                    f"{stored_count} items saved to {output_path}"
+                    f"{count} items saved to {output_path}"
                 )
                 LOGGER.info(message)
 
             except Exception as exc:
-                failed_entities.append(entity)
+                failed_entities[entity["id"]] = entity
                 error_msg = (
                     f"[ERROR] {account} / {entity.get('name')} "
                     f"({entity.get('id')}): {exc}"
                 )
                 LOGGER.error(error_msg)
 
+    for local_session in worker_sessions:
+        local_session.close()
+
     if counts_path and count_updates:
         update_entity_counts_file(counts_path, count_updates)
 
+    if count_updates:
+        known_counts.update(
+            (entity_id, count) for entity_id, (_, count) in count_updates.items()
+        )
+        write_item_counts(known_counts_path, known_counts)
+
     if failed_entities:
         LOGGER.warning(
             "Фабрики с ошибками (%d шт.): %s",
             len(failed_entities),
             ", ".join(
-                f"{f['name']} ({f['id']})" for f in failed_entities
+                f"{f['name']} ({f['id']})" for f in failed_entities.values()
             ),
         )
     else:
@@ -570,7 +739,8 @@ def main() -> None:
         LOGGER.info("=== %s ===", dataset_label)
 
         max_workers = min(len(tasks), MAX_WORKERS) or 1
-        retry_plan: Dict[str, List[Dict[str, str]]] = {}
+        # ключ — id фабрики: повторы схлопываются уже при сборе
+        retry_plan: Dict[str, Dict[str, Dict[str, str]]] = {}
 
         # первый проход: параллельно по аккаунтам
         with ThreadPoolExecutor(max_workers=max_workers) as executor:
@@ -590,13 +760,13 @@ def main() -> None:
                 try:
                     failures = future.result()
                     if failures:
-                        retry_plan.setdefault(account, []).extend(failures)
+                        retry_plan.setdefault(account, {}).update(failures)
                 except Exception as exc:
                     LOGGER.error(
                         "[%s] Ошибка выполнения задач: %s", account, exc
                     )
-                    retry_plan.setdefault(account, []).extend(
-                        list(tasks_dict.get(account, []))
+                    retry_plan.setdefault(account, {}).update(
+                        (entity["id"], entity) for entity in tasks_dict.get(account, [])
                     )
 
         # повторная попытка для упавших фабрик
@@ -605,17 +775,14 @@ def main() -> None:
 
         LOGGER.info("Повторная попытка для неудачных фабрик...")
         for account, pending in retry_plan.items():
-            unique: Dict[str, Dict[str, str]] = {}
-            for entity in pending:
-                unique[entity["id"]] = entity
-            remaining = list(unique.values())
+            remaining = list(pending.values())
             if not remaining:
                 continue
 
             failures = process_entities(account, remaining, config, LOGGER)
             if failures:
                 names = ", ".join(
-                    f"{f['name']} ({f['id']})" for f in failures
+                    f"{f['name']} ({f['id']})" for f in failures.values()
                 )
                 LOGGER.warning(
                     "После повторной попытки для %s остались ошибки: %s",
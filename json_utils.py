@@ -0,0 +1,44 @@
+from __future__ import annotations
+
+import json
+import os
+import tempfile
+from pathlib import Path
+
+try:
+    import orjson  # type: ignore
+except ImportError:  # optional: stdlib json is used instead
+    orjson = None
+
+
+def load_json(path: Path) -> object:
+    """Parse a JSON file from bytes; orjson errors subclass json.JSONDecodeError."""
+    raw = path.read_bytes()
+    return orjson.loads(raw) if orjson is not None else json.loads(raw)
+
+
+def dump_json(payload: object, indent: bool = True) -> bytes:
+    """UTF-8 JSON, indent=2 or compact; orjson emits bytes directly, no str + encode round trip."""
+    if orjson is not None:
+        return orjson.dumps(payload, option=orjson.OPT_INDENT_2) if indent else orjson.dumps(payload)
+    if indent:
+        return json.dumps(payload, ensure_ascii=False, indent=2).encode("utf-8")
+    return json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def atomic_write_json(path: Path, payload: object, indent: bool = False) -> None:
+    """Write via a temp file in the target dir and os.replace; the temp file is removed on failure."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_name = None
+    try:
+        with tempfile.NamedTemporaryFile(dir=path.parent, suffix=".tmp", delete=False) as tmp:
+            tmp_name = tmp.name
+            tmp.write(dump_json(payload, indent=indent))
+        os.replace(tmp_name, path)
+    except BaseException:
+        if tmp_name is not None:
+            try:
+                os.unlink(tmp_name)
+            except OSError:
+                pass
+        raise
@@ -1,8 +1,8 @@
 import argparse
-import json
 import logging
 from pathlib import Path
 
+from json_utils import atomic_write_json, dump_json, load_json
 from logging_utils import setup_logging
 
 ALL_FABRIKS = {
@@ -16,10 +16,35 @@ KILL_FABRIKS = {
     "XL_F_L": Path("Ignore") / "XL_L.json",
 }
 
+# подписи (mtime_ns, size) уже обработанных пар файлов — неизменённые пары не перечитываются
+KILL_CACHE_PATH = Path(".cache") / "killFabriks.json"
+
 LOGGER = logging.getLogger("killFabriks")
 
 
+def _file_sig(path: Path) -> list:
+    stat = path.stat()
+    return [stat.st_mtime_ns, stat.st_size]
+
+
+def _read_kill_cache() -> dict:
+    try:
+        data = load_json(KILL_CACHE_PATH)
+    except (OSError, ValueError):
+        return {}
+    return data if isinstance(data, dict) else {}
+
+
+def _write_kill_cache(cache: dict) -> None:
+    try:
+        atomic_write_json(KILL_CACHE_PATH, cache)
+    except OSError:
+        pass  # кэш — только оптимизация
+
+
 def kill_fabriks() -> None:
+    cache = _read_kill_cache()
+    cache_changed = False
     for fabrik_key, fabrik_path in ALL_FABRIKS.items():
         kill_path = KILL_FABRIKS.get(fabrik_key)
 
@@ -30,19 +55,28 @@ def kill_fabriks() -> None:
             LOGGER.info("[%s] Нет списка на удаление (пропуск): %s", fabrik_key, kill_path)
             continue
 
-        with open(fabrik_path, "r", encoding="utf-8") as f:
-            fabrik_data = json.load(f)
+        kill_sig = _file_sig(kill_path)
+        if kill_sig[1] == 0:
+            LOGGER.info("[%s] Список на удаление пуст (пропуск): %s", fabrik_key, kill_path)
+            continue
+        if cache.get(fabrik_key) == [_file_sig(fabrik_path), kill_sig]:
+            LOGGER.info("[%s] Файлы не менялись с прошлого запуска (пропуск)", fabrik_key)
+            continue
 
-        with open(kill_path, "r", encoding="utf-8") as f:
-            kill_data = json.load(f)
+        fabrik_data = load_json(fabrik_path)
+        kill_data = load_json(kill_path)
 
         kill_ids = {str(item.get("id", "")).strip() for item in kill_data}
-        before = list(fabrik_data)
-        removed = [item for item in before if str(item.get("id", "")).strip() in kill_ids]
-        filtered_data = [item for item in before if str(item.get("id", "")).strip() not in kill_ids]
+        # один проход: id каждой фабрики нормализуется один раз
+        removed = []
+        filtered_data = []
+        for item in fabrik_data:
+            (removed if str(item.get("id", "")).strip() in kill_ids else filtered_data).append(item)
 
-        with open(fabrik_path, "w", encoding="utf-8") as f:
-            json.dump(filtered_data, f, ensure_ascii=False, indent=2)
+        if removed:
+            fabrik_path.write_bytes(dump_json(filtered_data))
+        cache[fabrik_key] = [_file_sig(fabrik_path), kill_sig]
+        cache_changed = True
 
         # Логируем какие фабрики удалены
         if removed:
@@ -52,6 +86,9 @@ def kill_fabriks() -> None:
         else:
             LOGGER.info("[%s] Нечего удалять — совпадений не найдено", fabrik_key)
 
+    if cache_changed:
+        _write_kill_cache(cache)
+
 
 def parse_args() -> argparse.Namespace:
     parser = argparse.ArgumentParser(description="Удалить фабрики из коллекций по списку Ignore")
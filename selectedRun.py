@@ -79,7 +79,7 @@ def save_items_file(account: str, factory_id: str, factory_name: str, item_ids:
         "item_count": len(item_ids),
         "item_ids": list(item_ids),
     }
-    path.write_text(json.dumps(payload, ensure_ascii=False, indent=2), encoding="utf-8")
+    path.write_bytes(getItems.dump_json(payload, indent=False))
     return path
 
 